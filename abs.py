@@ -1,9 +1,21 @@
 """
 abs.py
+"""
+import numpy as np
+from collections import Counter
 from agents import *
 from common import *
+from contacts import *
+from policies import *
+
+ENGINE_VERSION = 2
 """
-import numpy as np
+The version of the simulation results: increase it with any change giving different results for the same
+parameters and seed, so the cached results (see cache.ResultCache) of the older code are not used
+"""
+
+RANDOM_STREAMS = ['positions', 'movement', 'incubation', 'contagion', 'death', 'detection']
+"""The purposes of the random numbers, each one drawn from its own stream with common random numbers"""
 
 def distance(a, b):
     return np.sqrt((a.x - b.x) ** 2 + (a.y - b.y) ** 2)
@@ -36,9 +48,62 @@ class Simulation(object):
         "A dictionary with conditional changes in the Simulation attributes"
         self.triggers_population = kwargs.get("triggers_population", [])
         "A dictionary with conditional changes in the Agent attributes"
+        self.triggers_population_vectorized = kwargs.get("triggers_population_vectorized", [])
+        "A dictionary with conditional changes in the Agent attributes, evaluated on the whole population at once"
         self.diagnosis_condition_symptom = kwargs.get("diagnosis_condition_symptom", '1 == 0')
+        '''The condition for a diagnosis after symptoms: a string expression on `agent`, a function or a policies.Policy'''
         self.diagnosis_condition_tracing = kwargs.get("diagnosis_condition_tracing", '1 == 0')
+        '''The condition for a diagnosis by contact tracing: a string expression on `agent`, a function or a policies.Policy'''
         self.prob_tracing_missed = kwargs.get("prob_tracing_missed", 0)
+        self.contact_tracing_days = kwargs.get("contact_tracing_days", None)
+        '''The lookback window of contact tracing in days: at its diagnosis, the contacts of an agent within the
+        window get a contact_time_since_diagnosis of 0 (to be used in the diagnosis conditions). None disables it'''
+        self.contact_history_width = kwargs.get("contact_history_width", 16)
+        '''The number of contacts remembered per agent for contact tracing, see contacts.ContactHistory'''
+        self.quarantine_contacts = kwargs.get("quarantine_contacts", False)
+        '''Contact tracing also isolates the traced contacts, for 14 days if they are not infected'''
+        self.contact_history = None
+        '''The recent contacts of the agents, a contacts.ContactHistory created at the first contacts'''
+        self.rng = kwargs.get("rng", None)
+        '''The random number generator of the simulation, a numpy.random.Generator'''
+        if self.rng is None:
+            self.rng = np.random.default_rng(kwargs.get("seed", None))
+        self.common_random_numbers = kwargs.get("common_random_numbers", False)
+        '''Common random numbers, for the comparison of scenarios: the random numbers of each purpose (see
+        RANDOM_STREAMS) come from their own stream spawned from rng, one number per agent, and the contagion
+        of an agent is decided by a single number per iteration (see contact), so simulations of different
+        scenarios with the same seed use the same numbers for the same agents'''
+        self.streams = None
+        '''With common random numbers, the random number generator of each purpose of RANDOM_STREAMS'''
+        if self.common_random_numbers:
+            self.streams = dict(zip(RANDOM_STREAMS, self.rng.spawn(len(RANDOM_STREAMS))))
+        self.incubations = None
+        '''With common random numbers, the incubation of each agent if it gets infected, drawn at initialize'''
+        self.survival = {}
+        '''With common random numbers, the probability of each susceptible agent to escape the contacts of
+        the current iteration so far, by agent id'''
+        self.contact_detection = kwargs.get("contact_detection", "grid")
+        '''The contact detection backend, a name in contacts.CONTACT_BACKENDS or a function with the same signature'''
+        self.transmissions = {}
+        '''The transmission index: for each infector id, the list of agents it infected, in order of infection'''
+        self.counters = Counter()
+        '''The running counts behind get_statistics, updated where the agents change (see _count)'''
+        self.check_counters = kwargs.get("check_counters", False)
+        '''Debug mode: get_statistics compares the running counts with a full recount of the population'''
+        self.active = {'infected': set(), 'isolated': set(), 'timed': set(), 'dead': set()}
+        '''The active sets: the population indexes of the infected, isolated, timer-bearing (living agents with
+        a time_since_* counter) and dead agents, kept up to date with the running counts (see _count)'''
+        self.positions = {}
+        '''The population index of each agent id'''
+        self.iteration = 0
+        '''The number of iterations executed'''
+        self.metrics = kwargs.get("metrics", None)
+        '''An optional metrics.PhaseMetrics (or compatible object) recording the time and events of each phase'''
+        self.observers = kwargs.get("observers", [])
+        '''Objects notified of the changes of the agents as they happen, e.g. aggregation.SIAggregator (see _emit)'''
+        self.force_of_infection = {}
+        '''The probability of infection per contact of each infected agent, by agent id, as a (day since symptom
+        onset, probability) tuple: an entry is only used while the day of its agent is unchanged'''
 
 
     def _xclip(self, x):
@@ -59,6 +124,17 @@ class Simulation(object):
         Update the population in the current iteration
         """
         self.population = pop
+        self.transmissions = {}
+        self.counters = Counter()
+        self.active = {name: set() for name in self.active}
+        self.positions = {a.id: k for k, a in enumerate(self.population)}
+        self.contact_history = None
+        if self.common_random_numbers:
+            self.incubations = incubation(1, size=len(self.population), rng=self.stream('incubation'))
+        for a in self.population:
+            if a.infector is not None:
+                self.transmissions.setdefault(a.infector, []).append(a)
+            self._count(a, 1)
 
     def set_amplitudes(self, amp):
         self.amplitudes = amp
@@ -86,9 +162,54 @@ class Simulation(object):
         """
         self.triggers_population.append({'condition': condition, 'attribute': attribute, 'action': action})
 
+    def append_trigger_population_vectorized(self, condition, attribute, action):
+        """
+        Append a conditional change in the population attributes, evaluated once per iteration (before the
+        movement) on the population in array form, e.g. a lockdown of the symptomatic agents:
+        sim.append_trigger_population_vectorized(lambda c: c['symptom_status'] == code(Symptom.Symptomatic),
+                                                 'mobility', lambda values: 0.0)
+
+        :param condition: a function that receives the population in array form (see agents.to_columns)
+        and returns a boolean mask of the agents to change
+        :param attribute: string, the attribute name of the agents which will be changed, e.g. 'mobility'
+        :param action: a function that receives the array of the current values of the attribute for the
+        masked agents (Enum codes for Enum attributes, NaN for None) and returns the new values
+        """
+        self.triggers_population_vectorized.append({'condition': condition, 'attribute': attribute,
+                                                    'action': action})
+
+    def apply_triggers_population_vectorized(self):
+        """
+        Evaluate the vectorized population triggers: only the columns read by the triggers are built from the
+        agents (see agents.LazyColumns), and only the masked agents are written back
+        """
+        if len(self.triggers_population_vectorized) == 0:
+            return
+        columns = LazyColumns(self.population)
+        for trigger in self.triggers_population_vectorized:
+            mask = np.asarray(trigger['condition'](columns), dtype=bool)
+            if not mask.any():
+                continue
+            attr = trigger['attribute']
+            values = columns[attr].copy()
+            values[mask] = trigger['action'](values[mask])
+            columns[attr] = values
+            for k in np.flatnonzero(mask):
+                agent = self.population[k]
+                self._count(agent, -1)
+                set_from_column(agent, attr, values[k])
+                self._count(agent, 1)
+
+    def stream(self, purpose):
+        """
+        :param purpose: a name in RANDOM_STREAMS
+        :return: the random number generator of the purpose, rng without common random numbers
+        """
+        return self.rng if self.streams is None else self.streams[purpose]
+
     def random_position(self):
-        x = np.random.uniform(0, self.length)
-        y = np.random.uniform(0, self.height)
+        x = self.stream('positions').uniform(0, self.length)
+        y = self.stream('positions').uniform(0, self.height)
 
         return x, y
 
@@ -131,36 +252,131 @@ class Simulation(object):
         for i in np.arange(0, self.population_size - len(self.population)):
             self.create_agent(Status.Susceptible)
 
-    def contact(self, agent1, agent2):
+        if self.common_random_numbers:
+            self.incubations = incubation(1, size=len(self.population), rng=self.stream('incubation'))
+
+        self.counters = Counter()
+        self.active = {name: set() for name in self.active}
+        self.positions = {a.id: k for k, a in enumerate(self.population)}
+        for a in self.population:
+            self._count(a, 1)
+            if a.status == Status.Infected:
+                self._emit(Event.Infection, a.id, -1, np.nan, a.incubation, iteration=-1)
+            elif a.status == Status.Recovered_Immune:
+                self._emit(Event.Recovery, a.id, -1, np.nan, np.nan, iteration=-1)
+
+    def _emit(self, kind, agent, other, value, value2, iteration=None):
+        """
+        Notify the observers of a change: each observer receives
+        record(iteration, kind, agent, other, value, value2), with scalars here and arrays of the same length
+        in VectorizedSimulation.
+
+        Event.Infection: agent is the infectee id, other the infector id (-1 for the initial infected, reported at
+        iteration -1), value the TSI and value2 the incubation of the infectee.
+        Event.Diagnosis: agent is the diagnosed id, other its infector id (-1 if none), value the
+        transmission_route_known and value2 the time_since_infection.
+        The other events (Symptom_Onset, Isolation_Start, Isolation_End, Death and Recovery, the latter also
+        for the initial immune at iteration -1) have other -1 and NaN values.
+        Changes made by population triggers are not reported.
+
+        :param kind: an agents.Event
+        :param iteration: the iteration of the change, by default the current one
+        """
+        for observer in self.observers:
+            observer.record(self.iteration if iteration is None else iteration, kind, agent, other, value, value2)
+
+    def _count(self, agent, sign):
+        """
+        Add (sign=1) or remove (sign=-1) the agent from the running counts of get_statistics and from the
+        active sets. Every change of a counted attribute or timer is wrapped between a removal and an addition
+
+        :param agent: an instance of agents.Agent
+        :param sign: 1 or -1
+        """
+        self.counters[agent.status] += sign
+        if agent.status != Status.Death:
+            self.counters[agent.symptom_status] += sign
+            self.counters[agent.isolation_status] += sign
+        if agent.transmission_route_known is not None:
+            self.counters['transmission_route_recorded'] += sign
+            if agent.transmission_route_known == 1:
+                self.counters['transmission_route_known'] += sign
+
+        k = self.positions[agent.id]
+        if sign < 0:
+            for active in self.active.values():
+                active.discard(k)
+        elif agent.status == Status.Death:
+            self.active['dead'].add(k)
+        else:
+            if agent.status == Status.Infected:
+                self.active['infected'].add(k)
+            if agent.isolation_status == Isolation.Isolated:
+                self.active['isolated'].add(k)
+            if (agent.time_since_infection is not None or agent.time_since_symptom_onset is not None or
+                    agent.time_since_diagnosis is not None or agent.time_since_isolation_start is not None or
+                    agent.infector_time_since_diagnosis is not None or
+                    agent.contact_time_since_diagnosis is not None):
+                self.active['timed'].add(k)
+
+    def contact(self, agent1, agent2, contagion_test=None):
         """
         Performs the actions needed when two agents get in touch.
         get infector, TSI for the infectee when infection occurs
+
+        With common random numbers, the contagion test is the number of agent1 for the whole iteration:
+        agent1 gets infected when its probability of infection by all its contacts of the iteration so far
+        reaches it, which gives the same probabilities as one test per contact
+
+        :param contagion_test: a uniform random number for the contagion test, drawn if not given
+        :return: True if agent1 got infected
         """
 
         if agent1.status == Status.Susceptible and (agent2.status == Status.Infected 
                                                     and agent2.isolation_status == Isolation.No_Isolation):
-            contagion_test = np.random.random()
-            if contagion_test <= SAR*infectiousness(agent2.time_since_infection - agent2.incubation):
+            day = agent2.time_since_infection - agent2.incubation
+            cached = self.force_of_infection.get(agent2.id)
+            if cached is None or cached[0] != day:
+                cached = (day, SAR*infectiousness_curve(day))
+                self.force_of_infection[agent2.id] = cached
+            if contagion_test is None:
+                contagion_test = self.stream('contagion').random()
+            probability = cached[1]
+            if self.common_random_numbers:
+                survival = self.survival.get(agent1.id, 1.0)
+                self.survival[agent1.id] = survival * (1 - probability)
+                probability = 1 - survival * (1 - probability)
+            if contagion_test <= probability:
+                self._count(agent1, -1)
                 agent1.status = Status.Infected
                 agent1.time_since_infection = 0
                 agent1.infection_status = Symptom.Asymptomatic
                 agent1.infector = agent2.id 
                 agent1.TSI = agent2.time_since_infection 
-                agent1.incubation = incubation(1)
+                if self.common_random_numbers:
+                    agent1.incubation = self.incubations[self.positions[agent1.id]]
+                else:
+                    agent1.incubation = incubation(1, rng=self.stream('incubation'))
                 agent1.infector_incubation = agent2.incubation
+                self.transmissions.setdefault(agent2.id, []).append(agent1)
+                self._count(agent1, 1)
+                self._emit(Event.Infection, agent1.id, agent2.id, agent1.TSI, agent1.incubation)
+                return True
                 """
                 This defines how long agent's incubation time will be.
                 if time_since_infection > incubation 
                 symptom_status turns symptomatic.
                 """
+        return False
 
 
-    def move(self, agent, triggers=[]):
+    def move(self, agent, triggers=[], step=None):
         """
         Performs the actions related with the movement of the agents in the shared environment
 
         :param agent: an instance of agents.Agent
         :param triggers: the list of population triggers related to the movement
+        :param step: two standard normal random numbers for the horizontal and vertical steps, drawn if not given
         """
 
         if agent.status == Status.Death:
@@ -172,8 +388,10 @@ class Simulation(object):
                 agent.x, agent.y = trigger['action'](agent)
                 return
 
-        ix = int(np.random.randn(1) * self.amplitudes[agent.status])
-        iy = int(np.random.randn(1) * self.amplitudes[agent.status])
+        if step is None:
+            step = self.stream('movement').standard_normal(2)
+        ix = int(step[0] * self.amplitudes[agent.status] * agent.mobility)
+        iy = int(step[1] * self.amplitudes[agent.status] * agent.mobility)
 
         if (agent.x + ix) <= 0 or (agent.x + ix) >= self.length:
             agent.x -= ix
@@ -187,9 +405,11 @@ class Simulation(object):
 
         dist = np.sqrt(ix ** 2 + iy ** 2)
 
-    def update(self, agent):
+    def update(self, agent, death_test=None):
         """
         Update the status of the agent
+
+        :param death_test: a uniform random number for the death test, drawn if not given
         """
 
         if agent.status == Status.Death:
@@ -204,43 +424,69 @@ class Simulation(object):
             agent.infector_time_since_diagnosis += 1
         if agent.time_since_infection != None:
             agent.time_since_infection += 1
+        if agent.contact_time_since_diagnosis != None:
+            agent.contact_time_since_diagnosis += 1
 
         if agent.status == Status.Infected:
             if agent.symptom_status == Symptom.Asymptomatic and agent.incubation != None:
                 if agent.incubation <= agent.time_since_infection:
+                    self._count(agent, -1)
                     agent.symptom_status = Symptom.Symptomatic
                     agent.time_since_symptom_onset = 0
+                    self._count(agent, 1)
+                    self._emit(Event.Symptom_Onset, agent.id, -1, np.nan, np.nan)
 
-            death_test = np.random.random()
+            if death_test is None:
+                death_test = self.stream('death').random()
             if (agent.symptom_status == Symptom.Symptomatic and 
                 agent.time_since_symptom_onset >= 10) and death_test <= IFR:
                 """
                 Infection fatality ratio is assumed to be 1% regardless of age
                 """
+                self._count(agent, -1)
                 agent.status = Status.Death
                 agent.symptom_status = Symptom.Asymptomatic
+                self._count(agent, 1)
+                self._emit(Event.Death, agent.id, -1, np.nan, np.nan)
                 return
 
             if (agent.symptom_status == Symptom.Symptomatic and 
                 agent.time_since_symptom_onset >= 10) and agent.status != Status.Death:
+                self._count(agent, -1)
                 agent.status = Status.Recovered_Immune
                 agent.symptom_status = Symptom.Asymptomatic
+                self._count(agent, 1)
+                self._emit(Event.Recovery, agent.id, -1, np.nan, np.nan)
 
-        if (agent.isolation_status == Isolation.Isolated and 
-            agent.time_since_isolation_start >= 14) and agent.status == Status.Recovered_Immune:
+        if (agent.isolation_status == Isolation.Isolated and agent.time_since_isolation_start >= 14 and
+                agent.status in (Status.Recovered_Immune, Status.Susceptible)):
+            """Only quarantined contacts can be isolated while susceptible"""
+            self._count(agent, -1)
             agent.isolation_status = Isolation.No_Isolation
+            self._count(agent, 1)
+            self._emit(Event.Isolation_End, agent.id, -1, np.nan, np.nan)
+
+    def diagnosis(self, agent, detectability_test=None):
+        """
+        Test the agent if it meets the tracing or the symptom diagnosis condition.
+        The conditions are compiled once (see policies.as_policy) and only evaluated for infected, undiagnosed agents
 
-    def diagnosis(self, agent):
-        detectability_test = np.random.random(1)
-        if (eval(self.diagnosis_condition_tracing) and 
-            (agent.status == Status.Infected and agent.diagnosis_status != Diagnosis.Diagnosed) and
-            detectability_test < detectability(agent.time_since_infection - agent.incubation)):
+        :param detectability_test: a uniform random number for the diagnostic test, drawn if not given
+        :return: True if the agent got diagnosed
+        """
+        if detectability_test is None:
+            detectability_test = self.stream('detection').random()
+        if not (agent.status == Status.Infected and agent.diagnosis_status != Diagnosis.Diagnosed):
+            return False
+        if (as_policy(self.diagnosis_condition_tracing)(agent) and
+            detectability_test < detectability_curve(agent.time_since_infection - agent.incubation)):
+            self._count(agent, -1)
             agent.transmission_route_known = 1
             agent.diagnosis_status = Diagnosis.Diagnosed
             agent.time_since_diagnosis = 0
-        elif (eval(self.diagnosis_condition_symptom) and 
-            (agent.status == Status.Infected and agent.diagnosis_status != Diagnosis.Diagnosed) and
-            detectability_test < detectability(agent.time_since_infection - agent.incubation)):
+        elif (as_policy(self.diagnosis_condition_symptom)(agent) and
+            detectability_test < detectability_curve(agent.time_since_infection - agent.incubation)):
+            self._count(agent, -1)
             agent.transmission_route_known = 0
             agent.diagnosis_status = Diagnosis.Diagnosed
             agent.time_since_diagnosis = 0
@@ -248,56 +494,193 @@ class Simulation(object):
             agent.isolation_status = Isolation.Isolated
             agent.time_since_isolation_start = 0
             """Diagnosis and isolation are coupled"""
-            for a in self.population:
-                if a.infector == agent.id:
-                    a.infector_time_since_diagnosis = agent.time_since_diagnosis
+            self._count(agent, 1)
+            for a in self.transmissions.get(agent.id, []):
+                a.infector_time_since_diagnosis = agent.time_since_diagnosis
+            self._emit(Event.Diagnosis, agent.id, -1 if agent.infector is None else agent.infector,
+                       agent.transmission_route_known, agent.time_since_infection)
+            self._emit(Event.Isolation_Start, agent.id, -1, np.nan, np.nan)
+            if self.contact_history is not None:
+                for k in self.contact_history.query(self.positions[agent.id], self.iteration)[1].tolist():
+                    self.trace(self.population[k])
+            return True
+        return False
+
+    def trace(self, agent):
+        """
+        Notify an agent met by a diagnosed agent within the contact tracing window, and quarantine it
+        if quarantine_contacts is set
+
+        :param agent: an instance of agents.Agent
+        """
+        if agent.status == Status.Death:
+            return
+        quarantine = self.quarantine_contacts and agent.isolation_status == Isolation.No_Isolation
+        self._count(agent, -1)
+        agent.contact_time_since_diagnosis = 0
+        if quarantine:
+            agent.isolation_status = Isolation.Isolated
+            agent.time_since_isolation_start = 0
+        self._count(agent, 1)
+        if quarantine:
+            self._emit(Event.Isolation_Start, agent.id, -1, np.nan, np.nan)
+
+    def record_contacts(self, first, second, size):
+        """
+        Remember the contacts of the iteration for contact tracing, if contact_tracing_days is set
+
+        :param first: array with the population indexes of the first agent of each contact
+        :param second: array with the population indexes of the second agent of each contact
+        :param size: the number of agents
+        """
+        if self.contact_tracing_days is None:
+            return
+        if self.contact_history is None:
+            self.contact_history = ContactHistory(size, self.contact_history_width, self.contact_tracing_days)
+        self.contact_history.add(first, second, self.iteration)
 
     def execute(self):
         """
         Execute a complete iteration cycle of the Simulation, executing all actions for each agent
         in the population and updating the statistics
         """
-        mov_triggers = [k for k in self.triggers_population if k['attribute'] == 'move']
-        other_triggers = [k for k in self.triggers_population if k['attribute'] != 'move']
-
-        for agent in self.population:
-            self.move(agent, triggers=mov_triggers)
-            self.update(agent)
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.start(self.iteration)
 
-            for trigger in other_triggers:
-                if trigger['condition'](agent):
-                    attr = trigger['attribute']
-                    agent.__dict__[attr] = trigger['action'](agent.__dict__[attr])
+        self.apply_triggers_population_vectorized()
 
-        dist = np.zeros((self.population_size, self.population_size))
-
-        contacts = []
-
-        for i in np.arange(0, self.population_size):
-            for j in np.arange(i + 1, self.population_size):
-                ai = self.population[i]
-                aj = self.population[j]
-
-                if distance(ai, aj) <= self.contagion_distance:
-                    contacts.append((i, j))
+        mov_triggers = [k for k in self.triggers_population if k['attribute'] == 'move']
+        other_triggers = [k for k in self.triggers_population if k['attribute'] != 'move']
 
-        for par in contacts:
+        """The random numbers of each phase are drawn in blocks, one row per agent or contact"""
+        steps = self.stream('movement').standard_normal((len(self.population), 2)).tolist()
+        death_tests = self.stream('death').random(len(self.population)).tolist()
+        if len(self.triggers_population) > 0:
+            for k, agent in enumerate(self.population):
+                self.move(agent, triggers=mov_triggers, step=steps[k])
+                self.update(agent, death_test=death_tests[k])
+
+                for trigger in other_triggers:
+                    if trigger['condition'](agent):
+                        attr = trigger['attribute']
+                        self._count(agent, -1)
+                        agent.__dict__[attr] = trigger['action'](agent.__dict__[attr])
+                        self._count(agent, 1)
+        else:
+            """Only agents with timers need an update: the others cannot change"""
+            for k, agent in enumerate(self.population):
+                self.move(agent, step=steps[k])
+            for k in sorted(self.active['timed']):
+                self.update(self.population[k], death_test=death_tests[k])
+        if metrics is not None:
+            metrics.phase('move_update')
+
+        contacts = self.get_contacts()
+        if self.contact_tracing_days is not None:
+            pairs = np.array(contacts, dtype=np.int64).reshape(-1, 2)
+            self.record_contacts(pairs[:, 0], pairs[:, 1], len(self.population))
+        self.force_of_infection = {}
+        if metrics is not None:
+            metrics.phase('contact_detection')
+            metrics.count('contacts', len(contacts))
+
+        infections = 0
+        if self.common_random_numbers:
+            """One number per agent, see contact"""
+            self.survival = {}
+            agent_tests = self.stream('contagion').random(len(self.population)).tolist()
+            contagion_tests = [(agent_tests[i], agent_tests[j]) for i, j in contacts]
+        else:
+            contagion_tests = self.stream('contagion').random((len(contacts), 2)).tolist()
+        for k, par in enumerate(contacts):
             ai = self.population[par[0]]
             aj = self.population[par[1]]
-            self.contact(ai, aj)
-            self.contact(aj, ai)
+            infections += self.contact(ai, aj, contagion_test=contagion_tests[k][0])
+            infections += self.contact(aj, ai, contagion_test=contagion_tests[k][1])
+        if metrics is not None:
+            metrics.phase('contact')
+            metrics.count('infections', infections)
 
         if len(self.triggers_simulation) > 0:
             for trigger in self.triggers_simulation:
                 if trigger['condition'](self):
                     attr = trigger['attribute']
                     self.__dict__[attr] = trigger['action'](self.__dict__[attr])
+        if metrics is not None:
+            metrics.phase('triggers')
+
+        diagnoses = 0
+        detectability_tests = self.stream('detection').random(len(self.population)).tolist()
+        """Only infected agents can be diagnosed; the ones infected in this iteration are already in the set"""
+        for k in sorted(self.active['infected']):
+            diagnoses += self.diagnosis(self.population[k], detectability_test=detectability_tests[k])
+        if metrics is not None:
+            metrics.phase('diagnosis')
+            metrics.count('diagnoses', diagnoses)
+            metrics.stop()
+
+        self.iteration += 1
+        self.statistics = None
+
+
+    def is_extinct(self):
+        """
+        Check if the epidemic is over: no infected agent and no isolated agent left. From then on, only the
+        positions and the timers of the agents change
 
-        for agent in self.population:
-            self.diagnosis(agent)
-        
+        :return: a boolean
+        """
+        statistics = self.get_statistics()
+        return statistics['Infected'] == 0 and statistics['Isolated'] == 0
+
+    def fast_forward(self, days):
+        """
+        Advance an extinct simulation (see is_extinct) by some iterations, updating only the timers of the agents:
+        the statistics and the SI data are the ones execute would give, without moving the agents.
+        The triggers are not evaluated
+
+        :param days: the number of iterations
+        """
+        for k in self.active['timed']:
+            agent = self.population[k]
+            for name in TIMERS:
+                if agent.__dict__[name] is not None:
+                    agent.__dict__[name] += days
+        self.iteration += days
         self.statistics = None
 
+    def get_contacts(self):
+        """
+        Find all pairs of agents closer than the contagion distance with the selected contact detection backend.
+        Dead and isolated agents are not contact candidates
+
+        :return: a list of (i, j) tuples of population indexes, with i < j
+        """
+        candidates = np.ones(len(self.population), dtype=bool)
+        candidates[list(self.active['dead'] | self.active['isolated'])] = False
+        candidates = np.flatnonzero(candidates)
+        x = np.array([self.population[k].x for k in candidates], dtype=float)
+        y = np.array([self.population[k].y for k in candidates], dtype=float)
+        first, second = contact_backend(self.contact_detection)(x, y, self.contagion_distance)
+        return list(zip(candidates[first].tolist(), candidates[second].tolist()))
+
+    def get_infectees(self, agent_id):
+        """
+        Return the agents infected by an agent
+
+        :param agent_id: the id of the infector
+        :return: a list with the ids of the infectees, in order of infection
+        """
+        return [a.id for a in self.transmissions.get(agent_id, [])]
+
+    def get_transmission_tree(self):
+        """
+        Return all the transmissions of the simulation
+
+        :return: a list of (infector id, infectee id) tuples
+        """
+        return [(infector, a.id) for infector, infectees in self.transmissions.items() for a in infectees]
 
     def get_positions(self):
         """Return the list of x,y positions for all agents"""
@@ -315,23 +698,31 @@ class Simulation(object):
         else:
             return [a.status.name for a in self.population]
     
+    def get_columns(self):
+        """
+        Return the population in array form
+        :return: a dictionary with one array per agent attribute, see agents.to_columns
+        """
+        return to_columns(self.population)
+
+    def set_columns(self, columns):
+        """
+        Replace the population by a population in array form
+        :param columns: a dictionary with one array per agent attribute, see agents.to_columns
+        """
+        self.set_population([from_columns(columns, i) for i in range(len(columns['id']))])
+
     def get_SIdata(self):
         """
         Return the SI dataframe of all agents
         SIdata: data needed to calculate different serial intervals (TSI, COSI, DSI)
         """
-        SIdata = pd.DataFrame(columns = ['ID','status','symptom_status','time_since_infection',
-                                         'incubation', 'time_since_symptom_onset', 'infetor_ID','TSI',
-                                         'diagnosis_status', 'time_since_diagnosis',
-                                         'isolation_status', 'infector_time_since_diagnosis', 'infector_incubation',
-                                         'transmission_route_known'])
-        for a in self.population:
-            SIdata = SIdata.append(a.get_SIdata(), ignore_index = True)
-        return SIdata
+        return SIdata_frame(self.get_columns())
 
     def get_statistics(self):
         """
-        Calculate and return the dictionary of the population statistics for the current iteration.
+        Return the dictionary of the population statistics for the current iteration,
+        from the running counts kept up to date by the simulation.
 
         :infection status statiscs, symptom status statistics, isolation status statistics
         :return: a dictionary
@@ -339,26 +730,47 @@ class Simulation(object):
         if self.statistics is None:
             self.statistics = {}
             for status in Status:
-                self.statistics[status.name] = np.sum(
-                    [1 for a in self.population if a.status == status]) / self.population_size
-
+                self.statistics[status.name] = self.counters[status] / self.population_size
             for symptom_status in Symptom:
-                self.statistics[symptom_status.name] = np.sum([1 for a in self.population if
-                                                                a.symptom_status == symptom_status and
-                                                                a.status != Status.Death]) / self.population_size
+                self.statistics[symptom_status.name] = self.counters[symptom_status] / self.population_size
             for isolation_status in Isolation:
-                self.statistics[isolation_status.name] = np.sum([1 for a in self.population if
-                                                                a.isolation_status == isolation_status and
-                                                                a.status != Status.Death]) / self.population_size
-            self.statistics['transmission_route_known'] = np.sum([1 for a in self.population if
-                                                                a.transmission_route_known == 1]) / np.sum([1 for a in self.population if
-                                                                a.transmission_route_known != None])
-
-
+                self.statistics[isolation_status.name] = self.counters[isolation_status] / self.population_size
+            self.statistics['transmission_route_known'] = np.divide(self.counters['transmission_route_known'],
+                                                                    self.counters['transmission_route_recorded'])
 
+            if self.check_counters:
+                recount = self.count_statistics()
+                for k in recount.keys():
+                    if not np.allclose(recount[k], self.statistics[k], equal_nan=True):
+                        raise RuntimeError("Population counter '{}' drifted: {} counted, {} on recount".format(
+                            k, self.statistics[k], recount[k]))
 
         return self.statistics
 
+    def count_statistics(self):
+        """
+        Calculate the dictionary of the population statistics by scanning the whole population
+
+        :return: a dictionary, see get_statistics
+        """
+        statistics = {}
+        for status in Status:
+            statistics[status.name] = np.sum(
+                [1 for a in self.population if a.status == status]) / self.population_size
+
+        for symptom_status in Symptom:
+            statistics[symptom_status.name] = np.sum([1 for a in self.population if
+                                                      a.symptom_status == symptom_status and
+                                                      a.status != Status.Death]) / self.population_size
+        for isolation_status in Isolation:
+            statistics[isolation_status.name] = np.sum([1 for a in self.population if
+                                                        a.isolation_status == isolation_status and
+                                                        a.status != Status.Death]) / self.population_size
+        statistics['transmission_route_known'] = np.sum([1 for a in self.population if
+                                                         a.transmission_route_known == 1]) / np.sum([1 for a in self.population if
+                                                         a.transmission_route_known != None])
+        return statistics
+
     def __str__(self):
         return str(self.get_description())
 
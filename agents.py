@@ -4,6 +4,7 @@ agents.py
 
 from enum import Enum
 import uuid
+import numpy as np
 
 
 class Status(Enum):
@@ -38,6 +39,75 @@ class Isolation(Enum):
     No_Isolation = 'nq'
     Isolated = 'cq'
 
+class Event(Enum):
+    """
+    Changes of an agent reported by the simulation to its observers
+    """
+    Infection = 1
+    Diagnosis = 2
+    Symptom_Onset = 3
+    Isolation_Start = 4
+    Isolation_End = 5
+    Death = 6
+    Recovery = 7
+
+AGENT_ENUMS = {'status': Status,
+               'symptom_status': Symptom,
+               'diagnosis_status': Diagnosis,
+               'isolation_status': Isolation}
+"""
+Agent attributes holding an Enum member.
+In array form they are stored as integer codes: the position of the member in its Enum
+"""
+
+AGENT_NUMBERS = ['time_since_infection', 'incubation', 'time_since_symptom_onset', 'time_since_diagnosis',
+                 'time_since_isolation_start', 'infector', 'TSI', 'infector_time_since_diagnosis',
+                 'infector_incubation', 'transmission_route_known', 'mobility', 'contact_time_since_diagnosis']
+"""
+Agent attributes holding a number or None.
+In array form they are stored as floats, with NaN standing for None
+"""
+
+COLUMNS = ['id', 'x', 'y'] + list(AGENT_ENUMS) + AGENT_NUMBERS
+"""The arrays of a population in array form, see to_columns"""
+
+TIMERS = ['time_since_symptom_onset', 'time_since_diagnosis', 'time_since_isolation_start',
+          'infector_time_since_diagnosis', 'time_since_infection', 'contact_time_since_diagnosis']
+"""The agent attributes counting days, incremented by Simulation.update while the agent is alive"""
+
+
+SI_COLUMNS = {'ID': 'id',
+              'status': 'status',
+              'symptom_status': 'symptom_status',
+              'time_since_infection': 'time_since_infection',
+              'incubation': 'incubation',
+              'time_since_symptom_onset': 'time_since_symptom_onset',
+              'infetor_ID': 'infector',
+              'TSI': 'TSI',
+              'diagnosis_status': 'diagnosis_status',
+              'time_since_diagnosis': 'time_since_diagnosis',
+              'isolation_status': 'isolation_status',
+              'infector_time_since_diagnosis': 'infector_time_since_diagnosis',
+              'infector_incubation': 'infector_incubation',
+              'transmission_route_known': 'transmission_route_known'}
+"""
+The columns of the serial interval (SI) data frame and the agent attribute each one holds
+"""
+
+
+_CODES = {member: k for enum in AGENT_ENUMS.values() for k, member in enumerate(enum)}
+
+
+def code(member):
+    """
+    Integer code of an Enum member in array form
+
+    :param member: a value of Status, Symptom, Diagnosis or Isolation
+    :return: the position of the member in its Enum
+    """
+    return _CODES[member]
+
+
 class Agent(object):
     """
     The container of Agent's attributes and status
@@ -64,6 +134,11 @@ class Agent(object):
         self.infector_time_since_diagnosis = kwargs.get('infector_time_since_diagnosis', None)
         self.infector_incubation = kwargs.get('infector_incubation', None)
         self.transmission_route_known = kwargs.get('transmission_route_known', None)
+        self.mobility = kwargs.get('mobility', 1.0)
+        """The factor of the amplitude of the movements of the agent, e.g. 0 for an agent in lockdown"""
+        self.contact_time_since_diagnosis = kwargs.get('contact_time_since_diagnosis', None)
+        """The days since the last diagnosis of an agent met within the contact tracing window, see
+        Simulation.contact_tracing_days"""
 
 
 
@@ -85,6 +160,7 @@ class Agent(object):
                   'infector_time_since_diagnosis': [self.infector_time_since_diagnosis],
                   'infector_incubation': [self.infector_incubation],
                   'transmission_route_known': [self.transmission_route_known]}
+        import pandas as pd
         return pd.DataFrame(SIdata)
 
     def get_description(self):
@@ -99,3 +175,103 @@ class Agent(object):
 
     def __str__(self):
         return str(self.status.name)
+
+
+def to_columns(population):
+    """
+    Convert a list of agents to array form
+
+    :param population: a list of agents.Agent instances
+    :return: a dictionary with one array per attribute: id, x, y, the AGENT_ENUMS codes and the AGENT_NUMBERS
+    """
+    return {name: to_column(population, name) for name in COLUMNS}
+
+
+def to_column(population, name):
+    """
+    Convert one attribute of a list of agents to array form
+
+    :param population: a list of agents.Agent instances
+    :param name: the attribute, a name of COLUMNS
+    :return: an array, see to_columns
+    """
+    if name == 'id':
+        return np.array([a.id for a in population], dtype=np.int64)
+    if name in ('x', 'y'):
+        return np.array([a.__dict__[name] for a in population], dtype=float)
+    if name in AGENT_ENUMS:
+        return np.array([code(a.__dict__[name]) for a in population], dtype=np.int8)
+    return np.array([np.nan if a.__dict__[name] is None else a.__dict__[name] for a in population], dtype=float)
+
+
+class LazyColumns(dict):
+    """
+    A list of agents in array form whose columns are only built when they are read, see to_columns
+    """
+    def __init__(self, population):
+        """
+        :param population: a list of agents.Agent instances
+        """
+        super(LazyColumns, self).__init__()
+        self.population = population
+
+    def __missing__(self, name):
+        if name not in COLUMNS:
+            raise KeyError(name)
+        self[name] = to_column(self.population, name)
+        return self[name]
+
+    def __contains__(self, name):
+        return name in COLUMNS
+
+
+def from_columns(columns, index):
+    """
+    Build one agent of a population in array form
+
+    :param columns: a dictionary of arrays, as returned by to_columns
+    :param index: the position of the agent in the arrays
+    :return: an agents.Agent instance
+    """
+    agent = Agent(id=int(columns['id'][index]), x=columns['x'][index].item(), y=columns['y'][index].item())
+    for name in AGENT_ENUMS:
+        set_from_column(agent, name, columns[name][index])
+    for name in AGENT_NUMBERS:
+        set_from_column(agent, name, columns[name][index])
+    return agent
+
+
+def set_from_column(agent, name, value):
+    """
+    Set an attribute of an agent from its value in array form
+
+    :param agent: an agents.Agent instance
+    :param name: the attribute, x, y or a name of AGENT_ENUMS or AGENT_NUMBERS
+    :param value: an Enum code, or a number with NaN for None
+    """
+    if name in AGENT_ENUMS:
+        agent.__dict__[name] = list(AGENT_ENUMS[name])[value]
+    elif np.isnan(value):
+        agent.__dict__[name] = None
+    elif name == 'infector':
+        agent.__dict__[name] = int(value)
+    else:
+        agent.__dict__[name] = float(value)
+
+
+def SIdata_frame(columns):
+    """
+    Build the serial interval data frame of a population in array form
+
+    :param columns: a dictionary of arrays, as returned by to_columns
+    :return: a Pandas Dataframe with the SI_COLUMNS, the Enum attributes as categories of their names
+    """
+    import pandas as pd
+    SIdata = {}
+    for name, attribute in SI_COLUMNS.items():
+        if attribute in AGENT_ENUMS:
+            SIdata[name] = pd.Categorical.from_codes(columns[attribute],
+                                                     categories=[m.name for m in AGENT_ENUMS[attribute]])
+        else:
+            SIdata[name] = columns[attribute]
+    return pd.DataFrame(SIdata)
@@ -0,0 +1,143 @@
+"""
+aggregation.py
+online serial interval (SI) aggregation: the distributions computed from the SI data, accumulated as the
+infections and diagnoses happen instead of being computed afterwards from the full agent tables
+"""
+from collections import Counter
+import numpy as np
+from agents import *
+
+SI_QUANTITIES = ['TSI', 'COSI', 'DSI', 'infector_incubation', 'transmission_route_known']
+"""
+The aggregated quantities:
+TSI, the time since infection of the infector at the transmission;
+COSI, the clinical onset serial interval, the incubation of the infectee plus the TSI minus the incubation
+of the infector;
+DSI, the diagnosis serial interval, the iteration of diagnosis of the infectee minus the one of its infector,
+counted once both are diagnosed;
+infector_incubation, the incubation of the infector at the transmission;
+transmission_route_known, 1 for a diagnosis by contact tracing and 0 for a diagnosis after symptoms
+"""
+
+SI_PAIRS = ['TSI', 'infector_incubation', 'incubation']
+"""
+The timings of each transmission counted jointly (see SIAggregator.pairs): the TSI and the incubation of the
+infector, and the incubation of the infectee
+"""
+
+
+class SIAggregator(object):
+    """
+    Observer of a simulation (see Simulation._emit) accumulating histograms by whole day of the SI quantities.
+    Give an instance to the simulation with the observers parameter. Aggregators of several simulations
+    of the same scenario are combined with merge.
+    """
+    def __init__(self):
+        self.histograms = {quantity: Counter() for quantity in SI_QUANTITIES}
+        '''For each quantity, the number of observations by day (the value rounded down)'''
+        self.moments = {quantity: np.zeros(3) for quantity in SI_QUANTITIES}
+        '''For each quantity, the number, the sum and the sum of squares of the exact values'''
+        self.pairs = Counter()
+        '''The number of transmissions by whole days of the infector and infectee timings of SI_PAIRS'''
+        self.incubation = {}
+        '''The incubation of each infected agent, by id'''
+        self.infectees = {}
+        '''The agents infected by each agent, by id'''
+        self.diagnosed = {}
+        '''The iteration of diagnosis of each diagnosed agent, by id'''
+
+    def _add(self, quantity, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        self.moments[quantity] += [len(values), values.sum(), (values ** 2).sum()]
+        days, counts = np.unique(np.floor(values).astype(np.int64), return_counts=True)
+        self.histograms[quantity].update(dict(zip(days.tolist(), counts.tolist())))
+
+    def record(self, iteration, kind, agent, other, value, value2):
+        """
+        Receive the changes of the simulation, one at a time or in arrays
+
+        :param iteration: the iteration of the changes
+        :param kind: an agents.Event
+        :param agent: the id(s) of the agents changed
+        :param other: the id(s) of the infectors, -1 if none
+        :param value: see Simulation._emit
+        :param value2: see Simulation._emit
+        """
+        agent = np.atleast_1d(agent).tolist()
+        other = np.atleast_1d(other).tolist()
+        value = np.atleast_1d(np.asarray(value, dtype=float))
+        value2 = np.atleast_1d(np.asarray(value2, dtype=float))
+
+        if kind == Event.Infection:
+            for k, a in enumerate(agent):
+                self.incubation[a] = value2[k]
+                if other[k] >= 0:
+                    self.infectees.setdefault(other[k], []).append(a)
+            """The infector can be infected in the same iteration, hence in the same arrays"""
+            infector_incubation = np.array([self.incubation.get(o, np.nan) for o in other])
+            self._add('TSI', value)
+            self._add('infector_incubation', infector_incubation)
+            self._add('COSI', value + value2 - infector_incubation)
+            timings = np.column_stack((value, infector_incubation, value2))
+            timings = timings[~np.isnan(timings).any(axis=1)]
+            self.pairs.update(map(tuple, np.floor(timings).astype(np.int64).tolist()))
+
+        elif kind == Event.Diagnosis:
+            dsi = []
+            for k, a in enumerate(agent):
+                self.diagnosed[a] = iteration
+                if other[k] in self.diagnosed:
+                    dsi.append(iteration - self.diagnosed[other[k]])
+                for infectee in self.infectees.get(a, []):
+                    if infectee in self.diagnosed:
+                        dsi.append(self.diagnosed[infectee] - iteration)
+            self._add('DSI', dsi)
+            self._add('transmission_route_known', value)
+
+    def merge(self, other):
+        """
+        Add the histograms of another aggregator, e.g. of another simulation of the same scenario
+
+        :param other: an SIAggregator
+        :return: this aggregator
+        """
+        for quantity in SI_QUANTITIES:
+            self.histograms[quantity].update(other.histograms[quantity])
+            self.moments[quantity] += other.moments[quantity]
+        self.pairs.update(other.pairs)
+        return self
+
+    def to_frame(self):
+        """
+        :return: a Pandas Dataframe with the histograms: one row per quantity and day with the count of observations
+        """
+        import pandas as pd
+        rows = [{'quantity': quantity, 'day': day, 'count': count}
+                for quantity in SI_QUANTITIES for day, count in sorted(self.histograms[quantity].items())]
+        return pd.DataFrame(rows, columns=['quantity', 'day', 'count'])
+
+    def pairs_frame(self):
+        """
+        :return: a Pandas Dataframe with the joint histogram of the infector and infectee timings: one row per
+        combination of days of SI_PAIRS with the count of transmissions
+        """
+        import pandas as pd
+        rows = [dict(zip(SI_PAIRS, days), count=count) for days, count in sorted(self.pairs.items())]
+        return pd.DataFrame(rows, columns=SI_PAIRS + ['count'])
+
+    def summary(self):
+        """
+        :return: a Pandas Dataframe with the number of observations, the mean and the standard deviation of each
+        quantity (for transmission_route_known, the mean is the rate of diagnoses by contact tracing)
+        """
+        import pandas as pd
+        rows = []
+        for quantity in SI_QUANTITIES:
+            n, total, squares = self.moments[quantity]
+            mean = total / n if n > 0 else np.nan
+            std = np.sqrt(max(squares / n - mean ** 2, 0) * n / (n - 1)) if n > 1 else np.nan
+            rows.append({'quantity': quantity, 'n': int(n), 'mean': mean, 'std': std})
+        return pd.DataFrame(rows)
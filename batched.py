@@ -0,0 +1,157 @@
+"""
+batched.py
+"""
+import numpy as np
+from vectorized import *
+
+
+class BatchedSimulation(VectorizedSimulation):
+    """
+    Several independent replicates of the same simulation stepped together: their populations are stacked,
+    one after the other, in the arrays of a VectorizedSimulation, so each phase of an iteration is one array
+    operation for all the replicates instead of one per simulation.
+
+    Each replicate has its own random number generator and draws the same numbers as a VectorizedSimulation
+    with the same seed, so replicate k gives the results of VectorizedSimulation(seed=seeds[k]) with the same
+    parameters. The contacts are only found within a replicate.
+    population_size and the initial percentages are the ones of each replicate. The agent ids are unique in the
+    batch: the ids of replicate k are shifted by k times population_size (see get_replicate_columns).
+    """
+    def __init__(self, **kwargs):
+        super(BatchedSimulation, self).__init__(**kwargs)
+        seeds = kwargs.get('seeds', None)
+        if seeds is None:
+            seeds = np.random.SeedSequence(kwargs.get('seed', None)).spawn(kwargs.get('replicates', 10))
+        self.rngs = [np.random.default_rng(seed) for seed in seeds]
+        '''The random number generator of each replicate, from the seeds parameter or spawned from the seed'''
+        self.replicates = len(self.rngs)
+        '''The number of replicates'''
+        self.replicate_streams = None
+        '''With common random numbers, the random number generator of each purpose of each replicate'''
+        if self.common_random_numbers:
+            self.replicate_streams = [dict(zip(RANDOM_STREAMS, rng.spawn(len(RANDOM_STREAMS))))
+                                      for rng in self.rngs]
+
+    def _draw(self, rows, purpose, draw):
+        """
+        Draw random numbers, the ones of each replicate from its own random number generator (of the purpose
+        with common random numbers)
+
+        :param rows: array with the population index of the agent of each number, sorted by replicate, or the
+        number of agents of the batch for one number per agent
+        :param purpose: a name in RANDOM_STREAMS
+        :param draw: a function (generator, size) returning an array of size random numbers
+        :return: an array with one random number per row
+        """
+        if np.isscalar(rows):
+            counts = np.full(self.replicates, rows // self.replicates)
+        else:
+            counts = np.bincount(np.asarray(rows) // self.population_size, minlength=self.replicates)
+        rngs = self.rngs
+        if self.replicate_streams is not None:
+            rngs = [streams[purpose] for streams in self.replicate_streams]
+        return np.concatenate([draw(rng, count) for rng, count in zip(rngs, counts)])
+
+    def _detect_contacts(self, candidates):
+        """
+        Find the contacts within each replicate with the contact detection backend
+
+        :param candidates: sorted array with the population indexes of the agents which can be in contact
+        :return: two arrays (i, j) of population indexes with i < j, sorted by replicate
+        """
+        bounds = np.searchsorted(candidates, np.arange(self.replicates + 1) * self.population_size)
+        pairs = [super(BatchedSimulation, self)._detect_contacts(candidates[start:end])
+                 for start, end in zip(bounds[:-1], bounds[1:])]
+        return (np.concatenate([first for first, _ in pairs]).astype(np.int64),
+                np.concatenate([second for _, second in pairs]).astype(np.int64))
+
+    def initialize(self):
+        """
+        Initializate the Simulation by creating the population of agents of each replicate
+        """
+        size = self.population_size
+        n = size * self.replicates
+        n_infected = int(self.population_size * self.initial_infected_perc)
+        n_immune = int(self.population_size * self.initial_immune_perc)
+
+        status = np.full(size, SUSCEPTIBLE, dtype=np.int8)
+        status[:n_infected] = INFECTED
+        status[n_infected:n_infected + n_immune] = RECOVERED_IMMUNE
+        status = np.tile(status, self.replicates)
+
+        self.columns = {'id': np.arange(1, n + 1, dtype=np.int64),
+                        'x': self._draw(n, 'positions', lambda rng, size: rng.uniform(0, self.length, size)),
+                        'y': self._draw(n, 'positions', lambda rng, size: rng.uniform(0, self.height, size)),
+                        'status': status,
+                        'symptom_status': np.full(n, ASYMPTOMATIC, dtype=np.int8),
+                        'diagnosis_status': np.full(n, UNDIAGNOSED, dtype=np.int8),
+                        'isolation_status': np.full(n, NO_ISOLATION, dtype=np.int8)}
+        for name in AGENT_NUMBERS:
+            self.columns[name] = np.full(n, np.nan)
+        self.columns['mobility'][:] = 1.0
+
+        """
+        Initial infected population
+        """
+        seeds = np.arange(n) % size < n_infected
+        self.columns['incubation'][seeds] = 3
+        self.columns['transmission_route_known'][seeds] = 0
+        self.columns['time_since_infection'][seeds] = 0
+        self._emit(Event.Infection, self.columns['id'][seeds], np.full(seeds.sum(), -1),
+                   np.full(seeds.sum(), np.nan), self.columns['incubation'][seeds], iteration=-1)
+        self._emit_changes(Event.Recovery, status == RECOVERED_IMMUNE, iteration=-1)
+        self._draw_incubations()
+
+    def get_replicate_columns(self, replicate):
+        """
+        Return the population of one replicate in array form, with the ids (and infector ids) it would have
+        in a VectorizedSimulation
+
+        :param replicate: the number of the replicate, from 0
+        :return: a dictionary with one array per agent attribute, see agents.to_columns
+        """
+        offset = replicate * self.population_size
+        columns = {name: column[offset:offset + self.population_size].copy()
+                   for name, column in self.columns.items()}
+        columns['id'] -= offset
+        columns['infector'] -= offset
+        return columns
+
+    def get_replicate_statistics(self):
+        """
+        Calculate the population statistics of each replicate for the current iteration
+
+        :return: a list with the dictionary of the statistics of each replicate, see VectorizedSimulation.get_statistics
+        """
+        c = self.columns
+        replicate = np.arange(len(c['status'])) // self.population_size
+        alive = c['status'] != DEATH
+        statistics = [{} for _ in range(self.replicates)]
+        for name, enum, rows in (('status', Status, slice(None)), ('symptom_status', Symptom, alive),
+                                 ('isolation_status', Isolation, alive)):
+            counts = np.bincount(replicate[rows] * len(enum) + c[name][rows],
+                                 minlength=self.replicates * len(enum)).reshape(self.replicates, len(enum))
+            for member in enum:
+                for k in range(self.replicates):
+                    statistics[k][member.name] = counts[k, code(member)] / self.population_size
+        route = c['transmission_route_known']
+        known = np.bincount(replicate[route == 1], minlength=self.replicates)
+        recorded = np.bincount(replicate[~np.isnan(route)], minlength=self.replicates)
+        for k in range(self.replicates):
+            statistics[k]['transmission_route_known'] = known[k] / recorded[k]
+        return statistics
+
+    def get_statistics(self):
+        """
+        Calculate and return the dictionary of the population statistics of the whole batch for the current
+        iteration: the averages of the replicates, and the transmission_route_known of all the diagnoses
+
+        :return: a dictionary
+        """
+        if self.statistics is None:
+            replicates = self.get_replicate_statistics()
+            self.statistics = {name: np.mean([statistics[name] for statistics in replicates])
+                               for name in replicates[0]}
+            route = self.columns['transmission_route_known']
+            self.statistics['transmission_route_known'] = np.sum(route == 1) / np.sum(~np.isnan(route))
+        return self.statistics
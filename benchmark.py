@@ -0,0 +1,173 @@
+"""
+benchmark.py
+measure how the simulation hot paths scale with the population size and density
+
+usage: python benchmark.py --sizes 1000 10000 --densities 0.28 1.0 --engines Simulation VectorizedSimulation
+       --backends grid --output benchmark.json [--compare baseline.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from experiments import *
+
+
+def benchmark_case(simulation_type, population_size, density, iterations=10, contact_detection='grid',
+                   batch_experiments=1, seed=0):
+    """
+    Measure one configuration of the simulation
+
+    :param simulation_type: the simulation engine, Simulation or VectorizedSimulation
+    :param population_size: the number of agents
+    :param density: the number of agents per unit of area; the shared environment is a square of
+    side sqrt(population_size / density) (the default Simulation has 1000 agents on 60 x 60, 0.28)
+    :param iterations: number of iterations timed
+    :param contact_detection: the contact detection backend, see contacts.CONTACT_BACKENDS
+    :param batch_experiments: number of simulations of the timed batch_experiment_SI run, 0 to skip it
+    :param seed: the seed of the simulations
+    :return: a dictionary with the configuration, the timings in seconds (per iteration for
+    execute, its phases, get_statistics and get_SIdata), the mean number of contacts, infections
+    and diagnoses per iteration and the peak memory of one iteration in MB
+    """
+    """The curves are tabulated and pandas is imported on first use: do it before the timings"""
+    infectiousness_curve(0.0)
+    detectability_curve(0.0)
+    import pandas
+
+    side = float(np.sqrt(population_size / density))
+    kwargs = dict(population_size=population_size, length=side, height=side, contact_detection=contact_detection)
+    timings = {}
+
+    start = time.perf_counter()
+    sim = simulation_type(seed=seed, metrics=PhaseMetrics(), **kwargs)
+    sim.initialize()
+    timings['initialize'] = time.perf_counter() - start
+
+    phases = {'execute': [], 'get_statistics': [], 'get_SIdata': []}
+    for it in range(iterations):
+        start = time.perf_counter()
+        sim.execute()
+        phases['execute'].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        sim.get_statistics()
+        phases['get_statistics'].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        sim.get_SIdata()
+        phases['get_SIdata'].append(time.perf_counter() - start)
+    for phase, values in phases.items():
+        timings[phase] = float(np.mean(values))
+    metrics = sim.metrics.to_frame().drop(columns='iteration').mean()
+    counts = {}
+    for name, value in metrics.items():
+        if name.endswith('_time'):
+            timings[name] = float(value)
+        else:
+            counts[name] = float(value)
+
+    if batch_experiments > 0:
+        """The statistics printed by batch_experiment_SI are not part of the report"""
+        with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            batch_experiment_SI(batch_experiments, iterations, os.path.join(directory, 'df_SI.csv'),
+                                os.path.join(directory, 'df_statistics.csv'), simulation_type=simulation_type,
+                                seed=seed, **kwargs)
+            timings['batch_experiment_SI'] = time.perf_counter() - start
+
+    tracemalloc.start()
+    sim = simulation_type(seed=seed, **kwargs)
+    sim.initialize()
+    sim.execute()
+    sim.get_statistics()
+    sim.get_SIdata()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {'engine': simulation_type.__name__,
+            'contact_detection': contact_detection,
+            'population_size': population_size,
+            'density': density,
+            'side': side,
+            'iterations': iterations,
+            'timings': timings,
+            'counts': counts,
+            'peak_memory_mb': peak / 2 ** 20}
+
+
+def run_benchmarks(engines, backends, sizes, densities, iterations=10, batch_experiments=1, seed=0):
+    """
+    Measure every combination of engine, contact detection backend, population size and density
+
+    :return: a list of dictionaries, see benchmark_case
+    """
+    results = []
+    for engine in engines:
+        for backend in backends:
+            for size in sizes:
+                for density in densities:
+                    result = benchmark_case(engine, size, density, iterations, backend, batch_experiments, seed)
+                    print('{engine:22} {contact_detection:10} N={population_size:<8} density={density:<8.3g} '
+                          'execute={execute:.4f}s get_statistics={get_statistics:.5f}s get_SIdata={get_SIdata:.4f}s '
+                          'peak={peak_memory_mb:.1f}MB'.format(**dict(result, **result['timings'])))
+                    results.append(result)
+    return results
+
+
+def compare_benchmarks(results, baseline):
+    """
+    Compare results with a baseline of the same configurations
+
+    :param results: a list of dictionaries, see benchmark_case
+    :param baseline: a list of dictionaries, e.g. read from the JSON output of an earlier run
+    :return: a list of dictionaries with the configuration and the speedup of each timing (baseline / result)
+    """
+    def key(result):
+        return result['engine'], result['contact_detection'], result['population_size'], result['density']
+
+    reference = {key(result): result for result in baseline}
+    comparison = []
+    for result in results:
+        if key(result) not in reference:
+            continue
+        base = reference[key(result)]
+        speedup = {phase: base['timings'][phase] / value
+                   for phase, value in result['timings'].items() if phase in base['timings'] and value > 0}
+        comparison.append(dict(zip(['engine', 'contact_detection', 'population_size', 'density'], key(result)),
+                               speedup=speedup))
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the simulation hot paths')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000])
+    parser.add_argument('--densities', type=float, nargs='+', default=[1000 / 3600])
+    parser.add_argument('--engines', nargs='+', default=['Simulation'], choices=list(SIMULATION_TYPES.keys()))
+    parser.add_argument('--backends', nargs='+', default=['grid'])
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--batch-experiments', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON file receiving the results')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare with')
+    args = parser.parse_args(argv)
+
+    engines = [SIMULATION_TYPES[engine] for engine in args.engines]
+    results = run_benchmarks(engines, args.backends, args.sizes, args.densities, args.iterations,
+                             args.batch_experiments, args.seed)
+    output = {'results': results}
+    if args.compare:
+        with open(args.compare) as f:
+            output['comparison'] = compare_benchmarks(results, json.load(f)['results'])
+        for comparison in output['comparison']:
+            print(comparison)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+    return output
+
+
+if __name__ == '__main__':
+    main()
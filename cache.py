@@ -0,0 +1,122 @@
+"""
+cache.py
+on-disk cache of the results of the simulations, addressed by a hash of everything that determines them
+"""
+import gzip
+import hashlib
+import json
+import os
+import pickle
+from enum import Enum
+from abs import *
+
+
+def _canonical(value):
+    """
+    JSON encoding of the parameter values which are not JSON types; functions make a simulation uncacheable
+    """
+    if isinstance(value, Policy) and not callable(value.condition):
+        return {'condition': value.condition, 'names': value.names}
+    if isinstance(value, Enum):
+        return value.name
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError("{} cannot be part of a cache key".format(type(value).__name__))
+
+
+class ResultCache(object):
+    """
+    Store the results of run_experiment in a directory, one gzip-compressed pickle per simulation, named by the
+    SHA-256 of the engine, ENGINE_VERSION, the seed, the number of iterations and all the parameters.
+    When the files take more than max_bytes, the least recently used ones are deleted.
+    """
+    def __init__(self, directory, max_bytes=2 ** 30):
+        """
+        :param directory: the directory of the cache, created if needed
+        :param max_bytes: the maximum size of the cache
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, simulation_type, seed, iterations, **kwargs):
+        """
+        Compute the key of a simulation
+
+        :param simulation_type: the simulation engine
+        :param seed: the seed of the simulation
+        :param iterations: the number of iterations
+        :param kwargs: the parameters of run_experiment and of the simulation
+        :return: a hexadecimal string, None if the simulation cannot be cached: without seed or with
+        parameters which are functions (e.g. triggers) or other objects
+        """
+        if seed is None:
+            return None
+        if isinstance(kwargs.get('amplitudes'), dict):
+            kwargs['amplitudes'] = {_canonical(status): value for status, value in kwargs['amplitudes'].items()}
+        description = {'engine': simulation_type.__name__, 'version': ENGINE_VERSION, 'seed': seed,
+                       'iterations': iterations, 'parameters': kwargs}
+        try:
+            text = json.dumps(description, sort_keys=True, default=_canonical)
+        except TypeError:
+            return None
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.directory, key + '.pkl.gz')
+
+    def get(self, key):
+        """
+        :param key: a key, see key()
+        :return: the stored result, None if there is none
+        """
+        file = self._file(key)
+        try:
+            with gzip.open(file, 'rb') as f:
+                result = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        os.utime(file)
+        return result
+
+    def put(self, key, result):
+        """
+        Store a result, then delete the least recently used results beyond max_bytes
+
+        :param key: a key, see key()
+        :param result: the result to store
+        """
+        file = self._file(key)
+        with gzip.open(file + '.tmp', 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(file + '.tmp', file)
+        self.evict()
+
+    def evict(self):
+        """
+        Delete the least recently used results until the cache takes at most max_bytes
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pkl.gz'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+    def invalidate(self, key=None):
+        """
+        Delete a stored result, or all of them
+
+        :param key: a key, see key(); None to empty the cache
+        """
+        names = os.listdir(self.directory) if key is None else [key + '.pkl.gz']
+        for name in names:
+            if name.endswith('.pkl.gz') and os.path.exists(os.path.join(self.directory, name)):
+                os.remove(os.path.join(self.directory, name))
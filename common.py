@@ -5,8 +5,7 @@ some epidemiological assumptions
 
 import numpy as np
 import math
-from scipy import stats
-from scipy.stats import gamma
+from functools import lru_cache
 
 IFR = 0.01
 """
@@ -18,14 +17,17 @@ SAR = 0.35
 SAR: Maximum Secondary Attack Rate is assumed to be 0.35 for close contacts
 """
     
-def incubation(n):
+def incubation(n, size=None, rng=None):
     """
     Infected agent's incubation time indicates
     time between infection and symptom onset
     randomly drawn from a lognormal distribution
-   (n is a dummy variable)
+   (n is a dummy variable, size is the number of draws as in numpy; None draws a single value,
+   rng is the numpy.random.Generator to draw from; None draws from the global numpy random state)
    """
-    return np.random.lognormal(mean=1.63, sigma=0.5)
+    if rng is None:
+        rng = np.random
+    return rng.lognormal(mean=1.63, sigma=0.5, size=size)
 
 
 def infectiousness(t):
@@ -34,6 +36,7 @@ def infectiousness(t):
     agent's infectiousness from Dr. Ashcroft's work doi:10.4414/smw.2020.20336 
     or a box function?: max(np.sign((t+4)*(-t+8)), 0)
     """
+    from scipy.stats import gamma
     return gamma.pdf(t, 97.18750, -25.625, 1/3.71875)/0.1511372
     """
     infectiousness function is not a p.d.f.
@@ -47,6 +50,7 @@ def detectability(t):
     detectability is defined as the probability of a positive test result given the agent is infected with SARS-CoV-2 (sensitivity).
     detectability is assumed to have the same shape as the infectiousness function.
     """
+    from scipy.stats import gamma
     return gamma.pdf(t, 97.18750, -25.625, 1/3.71875)/0.1511372
 
     """
@@ -55,3 +59,49 @@ def detectability(t):
     when the detectability is 1, the sensitivity of the PCR test is 100%.
     """
 
+
+class GammaCurve(object):
+    """
+    A scaled gamma p.d.f. tabulated once on a fine grid and evaluated by linear interpolation,
+    to avoid the per-call overhead of scipy.stats.gamma.pdf in the simulation loops.
+    It accepts a scalar or an array of days and returns 0 outside of the tabulated range,
+    where the p.d.f. is negligible. The table is built on the first evaluation, so scipy is only imported then.
+    """
+    def __init__(self, a, loc, scale, peak, step=0.01):
+        """
+        :param a: shape of the gamma distribution
+        :param loc: location of the gamma distribution
+        :param scale: scale of the gamma distribution
+        :param peak: the value dividing the p.d.f., so the curve is one at its maximum
+        :param step: the spacing of the table in days
+        """
+        self.parameters = (a, loc, scale, peak, step)
+        self.days = None
+        self.values = None
+
+    def _tabulate(self):
+        from scipy.stats import gamma
+        a, loc, scale, peak, step = self.parameters
+        mean, var = gamma.stats(a, loc, scale, moments='mv')
+        self.days = np.arange(loc, mean + 20 * np.sqrt(var) + step, step)
+        self.values = gamma.pdf(self.days, a, loc, scale) / peak
+
+    def __call__(self, t):
+        if self.values is None:
+            self._tabulate()
+        return np.interp(t, self.days, self.values, left=0.0, right=0.0)
+
+
+@lru_cache(maxsize=None)
+def gamma_curve(a, loc, scale, peak, step=0.01):
+    """
+    The GammaCurve of a parameter set, built on the first request and reused afterwards
+    """
+    return GammaCurve(a, loc, scale, peak, step)
+
+
+infectiousness_curve = gamma_curve(97.18750, -25.625, 1/3.71875, 0.1511372)
+"""Tabulated infectiousness function, see infectiousness"""
+
+detectability_curve = gamma_curve(97.18750, -25.625, 1/3.71875, 0.1511372)
+"""Tabulated detectability function, see detectability"""
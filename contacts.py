@@ -0,0 +1,318 @@
+"""
+contacts.py
+contact detection backends: find all pairs of agents closer than the contagion distance
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory, util
+import numpy as np
+
+_tiled = {'workers': None, 'backend': None, 'pid': None}
+"""The 'tiled' backend of this process (see tiled_contacts), its number of worker processes and the process id"""
+
+
+def bruteforce_contacts(x, y, contagion_distance):
+    """
+    Compare every pair of agents (reference implementation, O(N^2))
+
+    :param x: array with the horizontal positions of the agents
+    :param y: array with the vertical positions of the agents
+    :param contagion_distance: the minimal distance considered as contact
+    :return: two arrays (i, j) of population indexes with i < j, sorted by i and then j
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    first = []
+    second = []
+    for i in np.arange(0, len(x)):
+        dist = np.sqrt((x[i] - x[i + 1:]) ** 2 + (y[i] - y[i + 1:]) ** 2)
+        j = np.flatnonzero(dist <= contagion_distance) + i + 1
+        first.append(np.full(len(j), i))
+        second.append(j)
+    if len(first) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    return np.concatenate(first).astype(int), np.concatenate(second).astype(int)
+
+
+def grid_contacts(x, y, contagion_distance):
+    """
+    Find the contacts with a uniform grid (cell list) whose cells are as wide as the contagion distance,
+    so only agents in the same or in a neighbouring cell are compared.
+    The cost grows with the population size times the local density instead of the population size squared.
+    The pairs are the same, in the same order, as the ones of bruteforce_contacts.
+
+    :param x: array with the horizontal positions of the agents
+    :param y: array with the vertical positions of the agents
+    :param contagion_distance: the minimal distance considered as contact
+    :return: two arrays (i, j) of population indexes with i < j, sorted by i and then j
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n < 2 or contagion_distance <= 0:
+        return bruteforce_contacts(x, y, contagion_distance)
+
+    """
+    The cells are slightly wider than the contagion distance so that rounding in the division
+    can never place two agents in contact more than one cell apart
+    """
+    cell = contagion_distance * (1 + 1e-6)
+    cx = np.floor(x / cell).astype(np.int64)
+    cy = np.floor(y / cell).astype(np.int64)
+    cx -= cx.min() - 1
+    cy -= cy.min() - 1
+    ny = cy.max() + 2
+    keys = cx * ny + cy
+
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    index = np.arange(n)
+
+    first = []
+    second = []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            neighbour = keys + dx * ny + dy
+            start = np.searchsorted(sorted_keys, neighbour, side='left')
+            end = np.searchsorted(sorted_keys, neighbour, side='right')
+            counts = end - start
+            total = counts.sum()
+            if total == 0:
+                continue
+            i = np.repeat(index, counts)
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            j = order[np.repeat(start, counts) + offsets]
+            keep = i < j
+            first.append(i[keep])
+            second.append(j[keep])
+
+    i = np.concatenate(first)
+    j = np.concatenate(second)
+    dist = np.sqrt((x[i] - x[j]) ** 2 + (y[i] - y[j]) ** 2)
+    close = dist <= contagion_distance
+    i = i[close]
+    j = j[close]
+    sort = np.lexsort((j, i))
+    return i[sort], j[sort]
+
+
+def _tile_contacts(name, n, bounds, contagion_distance):
+    """
+    Find the contacts of the agents owned by one tile, in a worker process
+
+    :param name: the name of the shared memory block holding the x and y arrays
+    :param n: the number of agents
+    :param bounds: (x0, x1, y0, y1), the tile owns the agents with x0 <= x < x1 and y0 <= y < y1
+    :param contagion_distance: the minimal distance considered as contact
+    :return: two arrays (i, j) of population indexes with i < j and i owned by the tile
+    """
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        positions = np.ndarray((2, n), dtype=np.float64, buffer=block.buf)
+        x, y = positions[0], positions[1]
+        x0, x1, y0, y1 = bounds
+        """The halo holds the agents of the neighbouring tiles which can be in contact with an owned agent"""
+        halo = contagion_distance * (1 + 1e-6)
+        members = np.flatnonzero((x >= x0 - halo) & (x < x1 + halo) & (y >= y0 - halo) & (y < y1 + halo))
+        mx = x[members]
+        my = y[members]
+        owned = (mx >= x0) & (mx < x1) & (my >= y0) & (my < y1)
+        del positions, x, y
+    finally:
+        block.close()
+    i, j = grid_contacts(mx, my, contagion_distance)
+    keep = owned[i]
+    return members[i[keep]], members[j[keep]]
+
+
+class TiledContacts(object):
+    """
+    Parallel contact detection for large populations: the environment is split into tiles, and a pool of worker
+    processes finds the contacts of the agents owned by each tile, reading the positions from shared memory.
+    Each tile also reads a halo of agents around it, so the pairs crossing a tile border are found by the tile
+    owning their first agent, exactly once. The contacts are the same, in the same order, as the ones
+    of grid_contacts.
+    """
+    def __init__(self, workers=None, tiles=None, min_size=50000):
+        """
+        :param workers: the number of worker processes, by default the number of CPUs
+        :param tiles: the number of tiles, as an int (vertical strips) or as a (columns, rows) tuple;
+        by default two strips per worker
+        :param min_size: populations smaller than this are handled by grid_contacts in the calling process,
+        where the parallelism would not pay for the communication
+        """
+        self.workers = workers if workers is not None else os.cpu_count()
+        self.tiles = tiles if tiles is not None else 2 * self.workers
+        self.min_size = min_size
+        self.executor = None
+        '''The pool of worker processes, started on the first parallel call'''
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['executor'] = None
+        return state
+
+    def _bounds(self, x, y):
+        columns, rows = self.tiles if isinstance(self.tiles, tuple) else (self.tiles, 1)
+        xs = np.linspace(x.min(), x.max(), columns + 1)
+        ys = np.linspace(y.min(), y.max(), rows + 1)
+        xs[0] = ys[0] = -np.inf
+        xs[-1] = ys[-1] = np.inf
+        return [(xs[c], xs[c + 1], ys[r], ys[r + 1]) for c in range(columns) for r in range(rows)]
+
+    def __call__(self, x, y, contagion_distance):
+        """
+        :param x: array with the horizontal positions of the agents
+        :param y: array with the vertical positions of the agents
+        :param contagion_distance: the minimal distance considered as contact
+        :return: two arrays (i, j) of population indexes with i < j, sorted by i and then j
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        n = len(x)
+        if n < max(self.min_size, 2) or self.workers <= 1 or contagion_distance <= 0:
+            return grid_contacts(x, y, contagion_distance)
+
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        block = shared_memory.SharedMemory(create=True, size=2 * n * 8)
+        try:
+            positions = np.ndarray((2, n), dtype=np.float64, buffer=block.buf)
+            positions[0] = x
+            positions[1] = y
+            del positions
+            futures = [self.executor.submit(_tile_contacts, block.name, n, bounds, contagion_distance)
+                       for bounds in self._bounds(x, y)]
+            results = [future.result() for future in futures]
+        finally:
+            block.close()
+            block.unlink()
+
+        i = np.concatenate([result[0] for result in results])
+        j = np.concatenate([result[1] for result in results])
+        sort = np.lexsort((j, i))
+        return i[sort], j[sort]
+
+    def close(self):
+        """
+        Stop the worker processes
+        """
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+class ContactHistory(object):
+    """
+    The recent contacts of each agent, for contact tracing, in a ring buffer of fixed width per agent:
+    memory stays at size x width entries however long the simulation. When an agent has more contacts than
+    the width within the window, the oldest ones are forgotten.
+    The agents are identified by their population index.
+    """
+    def __init__(self, size, width=16, days=14):
+        """
+        :param size: the number of agents
+        :param width: the number of contacts remembered per agent
+        :param days: the lookback window of the queries
+        """
+        self.width = width
+        self.window = days
+        self.contact = np.full((size, width), -1, dtype=np.int32)
+        '''The population index of each remembered contact, -1 for an empty slot'''
+        self.day = np.zeros((size, width), dtype=np.int32)
+        '''The iteration of each remembered contact'''
+        self.next = np.zeros(size, dtype=np.int64)
+        '''The number of contacts added for each agent, whose remainder by the width is the next slot'''
+
+    def add(self, first, second, day):
+        """
+        Remember the contacts of an iteration, in both directions
+
+        :param first: array with the population indexes of the first agent of each contact
+        :param second: array with the population indexes of the second agent of each contact
+        :param day: the iteration
+        """
+        agents = np.concatenate((first, second)).astype(np.int64)
+        others = np.concatenate((second, first))
+        if len(agents) == 0:
+            return
+        order = np.argsort(agents, kind='stable')
+        agents = agents[order]
+        others = others[order]
+        rank = np.arange(len(agents)) - np.searchsorted(agents, agents, side='left')
+        counts = np.bincount(agents, minlength=len(self.next))
+        keep = rank >= counts[agents] - self.width
+        slot = (self.next[agents[keep]] + rank[keep]) % self.width
+        self.contact[agents[keep], slot] = others[keep]
+        self.day[agents[keep], slot] = day
+        self.next += counts
+
+    def query(self, agents, day):
+        """
+        Find the contacts of agents within the lookback window
+
+        :param agents: the population indexes of the agents
+        :param day: the current iteration
+        :return: two arrays (agent, contact) of population indexes, without duplicates, sorted by agent then contact
+        """
+        agents = np.atleast_1d(agents)
+        recent = (self.contact[agents] >= 0) & (self.day[agents] > day - self.window)
+        rows, slots = np.nonzero(recent)
+        pairs = np.unique(np.column_stack((agents[rows], self.contact[agents[rows], slots])), axis=0)
+        return pairs[:, 0], pairs[:, 1]
+
+
+def set_contact_workers(workers):
+    """
+    Set the number of worker processes of the 'tiled' backend in this process, e.g. the share of the CPUs left
+    to each process of a pool running simulations (see experiments.batch_experiment_SI). A running backend
+    is stopped and created again with these workers on its next use
+
+    :param workers: the number of worker processes, None for the number of CPUs
+    """
+    if _tiled['backend'] is not None and _tiled['pid'] == os.getpid():
+        _tiled['backend'].close()
+    _tiled['backend'] = None
+    _tiled['workers'] = workers
+
+
+def tiled_contacts():
+    """
+    The TiledContacts of the 'tiled' backend: one per process, created on the first use with the workers of
+    set_contact_workers, and stopped when the process exits
+
+    :return: a TiledContacts
+    """
+    if _tiled['backend'] is None or _tiled['pid'] != os.getpid():
+        """A backend inherited from a parent process is not used: its worker processes belong to the parent"""
+        backend = TiledContacts(workers=_tiled['workers'])
+        util.Finalize(backend, backend.close, exitpriority=10)
+        _tiled['backend'] = backend
+        _tiled['pid'] = os.getpid()
+    return _tiled['backend']
+
+
+CONTACT_BACKENDS = {'bruteforce': lambda: bruteforce_contacts,
+                    'grid': lambda: grid_contacts,
+                    'tiled': tiled_contacts}
+"""
+The available contact detection backends, selected by name with the contact_detection parameter of the Simulation:
+the factory returning the backend function of each name
+"""
+
+
+def contact_backend(contact_detection):
+    """
+    Resolve a contact detection backend
+
+    :param contact_detection: the name of a backend in CONTACT_BACKENDS or a function with the same signature,
+    e.g. TiledContacts(workers=8)
+    :return: the backend function
+    """
+    if callable(contact_detection):
+        return contact_detection
+    if contact_detection not in CONTACT_BACKENDS:
+        raise ValueError("Unknown contact detection backend '{}', choose one of {}".format(
+            contact_detection, list(CONTACT_BACKENDS.keys())))
+    return CONTACT_BACKENDS[contact_detection]()
@@ -0,0 +1,210 @@
+"""
+events.py
+event log: the changes of the agents streamed to a typed binary file, from which the SI data of any iteration
+is rebuilt, instead of a copy of the whole population at every iteration
+"""
+import json
+import os
+import numpy as np
+from agents import *
+
+EVENT_LOG_MAGIC = b'COVIDLOG'
+EVENT_LOG_VERSION = 1
+"""The version of the event log format, stored in every file"""
+
+EVENT_DTYPE = np.dtype([('iteration', '<i4'), ('kind', 'u1'), ('agent', '<i8'), ('other', '<i8'),
+                        ('value', '<f8'), ('value2', '<f8')])
+"""One record of the event log, see Simulation._emit for the meaning of the fields of each kind of agents.Event"""
+
+
+class EventLog(object):
+    """
+    Observer of a simulation (see Simulation._emit) appending every event to a binary file.
+    The file holds the EVENT_LOG_MAGIC, the EVENT_LOG_VERSION, a JSON header, the ids of the agents in population
+    order and the EVENT_DTYPE records, appended by chunks of chunk_size records during the run.
+    Changes made by population triggers are not in the log.
+
+    Usage: log = EventLog('events.log', sim); sim.observers.append(log); sim.initialize(); ...; log.close()
+    """
+    def __init__(self, file, simulation, chunk_size=100000):
+        """
+        :param file: filename of the event log
+        :param simulation: the logged simulation, whose agent ids are written at the start of the file
+        :param chunk_size: the number of records buffered before they are written
+        """
+        self.file = file
+        self.simulation = simulation
+        self.buffer = np.empty(chunk_size, dtype=EVENT_DTYPE)
+        '''The records not yet written'''
+        self.rows = 0
+        '''The number of records in the buffer'''
+        self.started = False
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['simulation'] = None
+        return state
+
+    def _start(self):
+        ids = np.asarray(self.simulation.get_columns()['id'], dtype='<i8')
+        header = json.dumps({'version': EVENT_LOG_VERSION, 'population': len(ids)}).encode('utf-8')
+        with open(self.file, 'wb') as f:
+            f.write(EVENT_LOG_MAGIC)
+            f.write(np.uint16(EVENT_LOG_VERSION).tobytes())
+            f.write(np.uint32(len(header)).tobytes())
+            f.write(header)
+            f.write(ids.tobytes())
+        self.started = True
+
+    def record(self, iteration, kind, agent, other, value, value2):
+        """
+        Append changes of the simulation, one at a time or in arrays, see Simulation._emit
+        """
+        agent = np.atleast_1d(agent)
+        n = len(agent)
+        start = 0
+        while start < n:
+            take = min(n - start, len(self.buffer) - self.rows)
+            records = self.buffer[self.rows:self.rows + take]
+            records['iteration'] = iteration
+            records['kind'] = kind.value
+            records['agent'] = agent[start:start + take]
+            records['other'] = np.broadcast_to(other, (n,))[start:start + take]
+            records['value'] = np.broadcast_to(np.asarray(value, dtype=float), (n,))[start:start + take]
+            records['value2'] = np.broadcast_to(np.asarray(value2, dtype=float), (n,))[start:start + take]
+            self.rows += take
+            start += take
+            if self.rows == len(self.buffer):
+                self.flush()
+
+    def flush(self):
+        """
+        Append the buffered records to the file
+        """
+        if not self.started:
+            self._start()
+        with open(self.file, 'ab') as f:
+            f.write(self.buffer[:self.rows].tobytes())
+        self.rows = 0
+
+    def close(self):
+        """
+        Write the remaining records
+        """
+        self.flush()
+
+
+class EventLogReader(object):
+    """
+    Read an event log (see EventLog) and rebuild the state of the population at any iteration
+    """
+    def __init__(self, file):
+        """
+        :param file: filename of the event log
+        """
+        with open(file, 'rb') as f:
+            if f.read(len(EVENT_LOG_MAGIC)) != EVENT_LOG_MAGIC:
+                raise ValueError("{} is not an event log".format(file))
+            version = int(np.frombuffer(f.read(2), dtype=np.uint16)[0])
+            if version > EVENT_LOG_VERSION:
+                raise ValueError("{} has event log version {}, this code reads up to version {}".format(
+                    file, version, EVENT_LOG_VERSION))
+            length = int(np.frombuffer(f.read(4), dtype=np.uint32)[0])
+            self.header = json.loads(f.read(length).decode('utf-8'))
+            offset = f.tell()
+        n = self.header['population']
+        self.ids = np.array(np.memmap(file, dtype='<i8', mode='r', offset=offset, shape=(n,)))
+        '''The ids of the agents, in population order'''
+        if os.path.getsize(file) > offset + 8 * n:
+            self.events = np.memmap(file, dtype=EVENT_DTYPE, mode='r', offset=offset + 8 * n)
+        else:
+            self.events = np.zeros(0, dtype=EVENT_DTYPE)
+        '''The records of the log, as a read-only memory-mapped structured array in order of iteration'''
+
+    def get_transmission_tree(self):
+        """
+        Return all the transmissions of the simulation
+
+        :return: a list of (infector id, infectee id) tuples
+        """
+        infections = self.events[(self.events['kind'] == Event.Infection.value) & (self.events['other'] >= 0)]
+        return list(zip(infections['other'].tolist(), infections['agent'].tolist()))
+
+    def get_columns(self, iteration):
+        """
+        Rebuild the population at the end of an iteration (the positions, the mobility and the
+        contact_time_since_diagnosis are not logged and are NaN)
+
+        :param iteration: the iteration, starting from 0; -1 for the population after initialize
+        :return: a dictionary with one array per agent attribute, see agents.to_columns
+        """
+        events = self.events[:np.searchsorted(self.events['iteration'], iteration, side='right')]
+        order = np.argsort(self.ids)
+        n = len(self.ids)
+
+        def stamps(kind):
+            """The iteration of the event of each agent, NaN without event"""
+            result = np.full(n, np.nan)
+            selected = events[events['kind'] == kind.value]
+            result[order[np.searchsorted(self.ids[order], selected['agent'])]] = selected['iteration']
+            return result, selected
+
+        infected, infections = stamps(Event.Infection)
+        onset = stamps(Event.Symptom_Onset)[0]
+        diagnosed, diagnoses = stamps(Event.Diagnosis)
+        isolated = stamps(Event.Isolation_Start)[0]
+        released = stamps(Event.Isolation_End)[0]
+        dead = stamps(Event.Death)[0]
+        recovered = stamps(Event.Recovery)[0]
+
+        """The timers of the dead agents stop at the iteration of their death"""
+        end = np.where(np.isnan(dead), iteration, np.minimum(iteration, dead))
+        columns = {'id': self.ids.copy(), 'x': np.full(n, np.nan), 'y': np.full(n, np.nan)}
+        for name in AGENT_NUMBERS:
+            columns[name] = np.full(n, np.nan)
+
+        status = np.full(n, code(Status.Susceptible), dtype=np.int8)
+        status[~np.isnan(infected)] = code(Status.Infected)
+        status[~np.isnan(recovered)] = code(Status.Recovered_Immune)
+        status[~np.isnan(dead)] = code(Status.Death)
+        symptom = np.full(n, code(Symptom.Asymptomatic), dtype=np.int8)
+        symptom[~np.isnan(onset) & np.isnan(recovered) & np.isnan(dead)] = code(Symptom.Symptomatic)
+        diagnosis = np.where(np.isnan(diagnosed), code(Diagnosis.Undiagnosed), code(Diagnosis.Diagnosed))
+        """Quarantined contacts can be isolated again after their release"""
+        isolation = np.where(~np.isnan(isolated) & ~(released > isolated), code(Isolation.Isolated),
+                             code(Isolation.No_Isolation))
+        columns['status'] = status
+        columns['symptom_status'] = symptom
+        columns['diagnosis_status'] = diagnosis.astype(np.int8)
+        columns['isolation_status'] = isolation.astype(np.int8)
+
+        columns['time_since_infection'] = end - infected
+        columns['time_since_symptom_onset'] = end - onset
+        columns['time_since_diagnosis'] = end - diagnosed
+        columns['time_since_isolation_start'] = end - isolated
+
+        index = order[np.searchsorted(self.ids[order], infections['agent'])]
+        columns['incubation'][index] = infections['value2']
+        columns['TSI'][index] = infections['value']
+        seeds = infections['other'] < 0
+        """The initial infected have no infector and a transmission_route_known of 0 until their diagnosis"""
+        columns['transmission_route_known'][index[seeds]] = 0
+        index, infections = index[~seeds], infections[~seeds]
+        infector = order[np.searchsorted(self.ids[order], infections['other'])]
+        columns['infector'][index] = infections['other']
+        columns['infector_incubation'][index] = columns['incubation'][infector]
+        """The infectees are notified at the diagnosis of their infector, dead or alive"""
+        columns['infector_time_since_diagnosis'][index] = np.maximum(end[index] - diagnosed[infector], 0)
+
+        index = order[np.searchsorted(self.ids[order], diagnoses['agent'])]
+        columns['transmission_route_known'][index] = diagnoses['value']
+        return columns
+
+    def get_SIdata(self, iteration):
+        """
+        Rebuild the SI dataframe of all agents at the end of an iteration, as returned then by Simulation.get_SIdata
+
+        :param iteration: the iteration, starting from 0
+        :return: a Pandas Dataframe
+        """
+        return SIdata_frame(self.get_columns(iteration))
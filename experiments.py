@@ -1,70 +1,512 @@
 """
 experiments.py
-from abs import *
+run batches of simulations; as a script, run the scenarios of a configuration file
+
+usage: python experiments.py scenarios.json [--scenarios never 'sym3DSI*'] [--workers 4] [--list]
+       [--compare differences.csv]
 """
+import argparse
+import fnmatch
+import itertools
+import json
+import os
+import shutil
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+from abs import *
+from vectorized import *
+from batched import *
+from recorder import *
+from metrics import *
+from aggregation import *
+from events import *
+from cache import *
+
+def run_experiment(experiment, seed, iterations, simulation_type=Simulation, metrics=False, SIdata=True,
+                   si_summary=False, event_log=None, stop_at_extinction=True, SIfile=None, **kwargs):
+    """
+    Execute one simulation and collect its statistics and SI data by iteration
+
+    :param experiment: the number of the simulation in the batch
+    :param seed: the seed of the random numbers of the simulation
+    :param iterations: number of iterations of the simulation
+    :param simulation_type: the simulation engine, Simulation or VectorizedSimulation
+    :param metrics: if True, measure the phases of each iteration with a metrics.PhaseMetrics
+    :param SIdata: if False, do not record the SI data
+    :param si_summary: if True, aggregate the SI distributions with an aggregation.SIAggregator
+    :param event_log: filename of an events.EventLog receiving the changes of the agents, None for no log
+    :param stop_at_extinction: if True, once the epidemic is extinct (see Simulation.is_extinct) the remaining
+    iterations only advance the timers of the agents (see Simulation.fast_forward), which gives the same statistics
+    and SI data; ignored with population triggers
+    :param SIfile: filename of a csv file receiving the SI data as it is recorded, None to keep it in memory
+    :param kwargs: the parameters of the simulation
+    :return: a list with the statistics of each iteration, the SI data (a Pandas Dataframe, SIfile with an SIfile,
+    None without SIdata), a list with the phase metrics of each iteration (empty without metrics) and the
+    SIAggregator (None without si_summary)
+    """
+    verbose = kwargs.get('verbose', None)
+    if verbose == 'experiments':
+        print('Experiment {}'.format(experiment))
+    if metrics:
+        kwargs['metrics'] = PhaseMetrics()
+    aggregator = None
+    if si_summary:
+        aggregator = SIAggregator()
+        kwargs['observers'] = list(kwargs.get('observers', [])) + [aggregator]
+    sim = simulation_type(seed=seed, **kwargs)
+    log = None
+    if event_log is not None:
+        log = EventLog(event_log, sim)
+        sim.observers = list(sim.observers) + [log]
+    sim.initialize()
+
+    rows = []
+    recorder = SIRecorder(file=SIfile)
+    stop_at_extinction = (stop_at_extinction and len(sim.triggers_population) == 0 and
+                          len(sim.triggers_population_vectorized) == 0)
+    for it in range(iterations):
+        if verbose == 'iterations':
+            print('Experiment {}\tIteration {}'.format(experiment, it))
+        if stop_at_extinction and sim.is_extinct():
+            sim.fast_forward(1)
+        else:
+            sim.execute()
+        if SIdata:
+            recorder.record(sim.get_columns(), iteration=it, experiment=experiment)
+        statistics = sim.get_statistics()
+        statistics['iteration'] = it
+        statistics['experiment'] = experiment
+        rows.append(statistics)
+    if log is not None:
+        log.close()
+
+    metric_rows = []
+    if metrics:
+        for row in sim.metrics.rows:
+            metric_rows.append(dict(row, experiment=experiment))
+    return rows, _SIresult(recorder) if SIdata else None, metric_rows, aggregator
+
+
+def _SIresult(recorder):
+    """
+    The SI data of a simulation as returned by run_experiment: the file of the recorder, or its data in memory
+    """
+    if recorder.file is None:
+        return recorder.to_frame()
+    recorder.close()
+    return recorder.file
+
 
-def batch_experiment_SI(experiments, iterations, file, file2='df_statistics.csv', simulation_type=Simulation, **kwargs):
+def run_batched_experiment(experiments, seeds, iterations, metrics=False, SIdata=True, si_summary=False,
+                           stop_at_extinction=True, SIfiles=None, **kwargs):
+    """
+    Execute several simulations with the same parameters together, as the replicates of a
+    batched.BatchedSimulation: each one gives the results of run_experiment with VectorizedSimulation and its seed
+
+    :param experiments: the numbers of the simulations in the batch
+    :param seeds: the seed of each simulation
+    :param iterations: number of iterations of the simulations
+    :param metrics: if True, measure the phases of each iteration of the batch with a metrics.PhaseMetrics
+    :param SIdata: if False, do not record the SI data
+    :param si_summary: if True, aggregate the SI distributions of all the simulations with an
+    aggregation.SIAggregator
+    :param stop_at_extinction: if True, once the epidemic is extinct in all the simulations, the remaining
+    iterations only advance the timers of the agents, see run_experiment
+    :param SIfiles: the filename of the csv file receiving the SI data of each simulation, see run_experiment;
+    None to keep them in memory
+    :param kwargs: the parameters of the simulation
+    :return: a list with the result of each simulation as returned by run_experiment; the phase metrics
+    and the SIAggregator, which cover all the simulations, come with the first one
+    """
+    verbose = kwargs.get('verbose', None)
+    if verbose == 'experiments':
+        print('Experiments {}'.format(list(experiments)))
+    if metrics:
+        kwargs['metrics'] = PhaseMetrics()
+    aggregator = None
+    if si_summary:
+        aggregator = SIAggregator()
+        kwargs['observers'] = list(kwargs.get('observers', [])) + [aggregator]
+    sim = BatchedSimulation(seeds=seeds, **kwargs)
+    sim.initialize()
+
+    rows = [[] for _ in experiments]
+    recorders = [SIRecorder(file=SIfile) for SIfile in (SIfiles or [None] * len(experiments))]
+    stop_at_extinction = stop_at_extinction and len(sim.triggers_population_vectorized) == 0
+    for it in range(iterations):
+        if verbose == 'iterations':
+            print('Experiments {}\tIteration {}'.format(list(experiments), it))
+        if stop_at_extinction and sim.is_extinct():
+            sim.fast_forward(1)
+        else:
+            sim.execute()
+        for k, (experiment, statistics) in enumerate(zip(experiments, sim.get_replicate_statistics())):
+            if SIdata:
+                recorders[k].record(sim.get_replicate_columns(k), iteration=it, experiment=experiment)
+            statistics['iteration'] = it
+            statistics['experiment'] = experiment
+            rows[k].append(statistics)
+
+    metric_rows = []
+    if metrics:
+        for row in sim.metrics.rows:
+            metric_rows.append(dict(row, experiment=experiments[0], replicates=len(experiments)))
+    return [(rows[k], _SIresult(recorders[k]) if SIdata else None, metric_rows if k == 0 else [],
+             aggregator if k == 0 else None) for k in range(len(experiments))]
+
+
+def run_group(experiments, seeds, iterations, simulation_type=Simulation, event_logs=None, SIfiles=None, **kwargs):
+    """
+    Execute several simulations with the same parameters, one after the other, or together with BatchedSimulation
+
+    :param experiments: the numbers of the simulations
+    :param seeds: the seed of each simulation
+    :param iterations: number of iterations of the simulations
+    :param simulation_type: the simulation engine, Simulation, VectorizedSimulation or BatchedSimulation
+    :param event_logs: the filename of the event log of each simulation, see run_experiment; not supported
+    with BatchedSimulation
+    :param SIfiles: the filename of the csv file receiving the SI data of each simulation, see run_experiment
+    :param kwargs: the parameters of run_experiment and of the simulation
+    :return: a list with the result of each simulation, see run_experiment
+    """
+    event_logs = event_logs or [None] * len(experiments)
+    SIfiles = SIfiles or [None] * len(experiments)
+    if simulation_type is BatchedSimulation:
+        if any(log is not None for log in event_logs):
+            raise ValueError("Event logs are not supported with BatchedSimulation")
+        return run_batched_experiment(experiments, seeds, iterations, SIfiles=SIfiles, **kwargs)
+    return [run_experiment(experiment, seed, iterations, simulation_type, event_log=log, SIfile=SIfile, **kwargs)
+            for experiment, seed, log, SIfile in zip(experiments, seeds, event_logs, SIfiles)]
+
+
+def _append_SIdata(SIdata, file, written):
+    """
+    Append the SI data of a simulation to the csv file of a batch
+
+    :param SIdata: a Pandas Dataframe, or the filename of a csv file (see run_experiment), which is deleted
+    :param file: filename of the csv file of the batch
+    :param written: True if the file already holds the header
+    """
+    if isinstance(SIdata, str):
+        with open(SIdata) as part, open(file, 'a' if written else 'w') as f:
+            header = part.readline()
+            if not written:
+                f.write(header)
+            shutil.copyfileobj(part, f)
+        os.remove(SIdata)
+    else:
+        SIdata.to_csv(file, mode='a' if written else 'w', header=not written, index=False)
+
+
+def confidence_widths(df_statistics, iteration, statistics, confidence=0.95):
+    """
+    Compute the width of the confidence interval of the mean of statistics over the simulations of a batch
+
+    :param df_statistics: the statistics by iteration and experiment, as returned by batch_experiment_SI
+    :param iteration: the iteration whose values are compared, e.g. the last one
+    :param statistics: the names of the statistics
+    :param confidence: the confidence level
+    :return: a dictionary with the width of the interval of each statistic, infinite with less than two values
+    """
+    from scipy import stats
+    widths = {}
+    for statistic in statistics:
+        values = np.array([], dtype=float)
+        if len(df_statistics) > 0:
+            values = df_statistics.loc[df_statistics['iteration'] == iteration, statistic].astype(float).values
+        values = values[~np.isnan(values)]
+        if len(values) < 2:
+            widths[statistic] = np.inf
+        else:
+            quantile = stats.t.ppf((1 + confidence) / 2, len(values) - 1)
+            widths[statistic] = 2 * quantile * values.std(ddof=1) / np.sqrt(len(values))
+    return widths
+
+
+def batch_experiment_SI(experiments, iterations, file, file2='df_statistics.csv', simulation_type=Simulation,
+                        workers=1, seed=None, metrics_file=None, si_summary_file=None, si_pairs_file=None,
+                        event_log_file=None, target_width=None, target_statistics=('Recovered_Immune', 'transmission_route_known'),
+                        confidence=0.95, min_experiments=5, cache=None, replicates=10, **kwargs):
     """
     Execute several simulations with the same parameters and store the average statistics by iteration
 
-    :param experiments: number of simulations to be performed
+    :param experiments: number of simulations to be performed (the maximum number with target_width)
     :param iterations: number of iterations on each simulation
-    :param file: filename to store the consolidated statistics
+    :param file: filename to store the detailed agent information by iteration, None to skip it
+    (e.g. when si_summary_file gives the needed distributions); each simulation writes it to its own part file
+    (file followed by .part and the number of the simulation), appended to file in order, so the memory
+    does not grow with the number of simulations
+    :param simulation_type: the simulation engine, Simulation, VectorizedSimulation or BatchedSimulation
+    :param workers: number of processes running the simulations (or the groups of replicates) in parallel,
+    with at most twice as many submitted ahead of the results; with more than one, the parameters of the
+    simulation must be picklable (no lambda triggers), and the 'tiled' contact detection of each process uses
+    its share of the CPUs (see contacts.set_contact_workers)
+    :param seed: the seed from which the independent seed of each simulation is derived, None for a random one
+    :param metrics_file: filename to store the time and the number of contacts, infections and diagnoses
+    of each phase by iteration (see metrics.PhaseMetrics), None to skip the measurements
+    :param si_summary_file: filename to store the histograms of the SI quantities of all the simulations
+    (see aggregation.SIAggregator), None to skip them
+    :param si_pairs_file: filename to store the joint histogram of the infector and infectee timings of the
+    transmissions of all the simulations (see aggregation.SIAggregator.pairs_frame), None to skip it
+    :param event_log_file: filename pattern of the event log of each simulation (see events.EventLog), formatted
+    with the number of the simulation, e.g. 'events_{}.log'; None for no log
+    :param target_width: adaptive replication: simulations are added (min_experiments first, then one per worker)
+    until the confidence interval of the final value of each target statistic is narrower than target_width,
+    or until experiments simulations; None to always perform experiments simulations
+    :param target_statistics: the statistics whose confidence interval is checked, see Simulation.get_statistics
+    :param confidence: the confidence level of the intervals
+    :param min_experiments: the number of simulations before the first check
+    :param cache: a cache.ResultCache, or its directory, storing the results of each simulation so that a simulation
+    with the same engine, parameters, seed and number of iterations is not executed again; only used with a seed,
+    without metrics_file nor event_log_file and with parameters which are not functions
+    :param replicates: with BatchedSimulation, the maximum number of simulations executed together
+    (see run_batched_experiment); the results do not depend on it
     :param kwargs: the parameters of the simulation
     :save, return and print: a Pandas Dataframe with the consolidated statistics by iteration
     :save: a Pandas Dataframe with the detailed agent information by iteration
     """
-    verbose = kwargs.get('verbose', None)
+    import pandas as pd
+    seed_sequence = np.random.SeedSequence(seed)
+    options = {'metrics': metrics_file is not None, 'SIdata': file is not None,
+               'si_summary': si_summary_file is not None or si_pairs_file is not None}
+    if isinstance(cache, str):
+        cache = ResultCache(cache)
+    if seed is None or metrics_file is not None or event_log_file is not None:
+        cache = None
+    if simulation_type is BatchedSimulation and options['si_summary']:
+        """The SI aggregator of a group of replicates is returned with its first simulation only"""
+        cache = None
     rows = []
-    columns = None
-    All_SIdata = pd.DataFrame()
-    for experiment in range(experiments):
-        try:
-            if verbose == 'experiments':
-                print('Experiment {}'.format(experiment))
-            sim = simulation_type(**kwargs)
-            sim.initialize()
-
-            if columns is None:
-                statistics = sim.get_statistics()
-                columns = [k for k in statistics.keys()]
-
-            for it in range(iterations):
-                if verbose == 'iterations':
-                    print('Experiment {}\tIteration {}'.format(experiment, it))
-                sim.execute()
-                SIdata = sim.get_SIdata()
-                SIdata['iteration'] = it
-                All_SIdata = All_SIdata.append(SIdata)
-                statistics = sim.get_statistics()
-                statistics['iteration'] = it
-                rows.append(statistics)
-
-        except Exception as ex:
-            print("Exception occurred in experiment {}: {}".format(experiment, ex))
-
-    df = pd.DataFrame(All_SIdata)
-    df_statistics = pd.DataFrame(rows, columns=[k for k in statistics.keys()])
-    df.to_csv(file, index=False)
+    metric_rows = []
+    aggregator = SIAggregator()
+    written = False
+    if workers > 1:
+        """The CPUs are shared: the 'tiled' contact detection of each process gets its part of them"""
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=set_contact_workers,
+                                       initargs=(max(1, (os.cpu_count() or 1) // workers),))
+
+    done = 0
+    while done < experiments:
+        size = experiments - done
+        if target_width is not None:
+            size = min(size, max(min_experiments - done, workers, 1))
+        batch = range(done, done + size)
+        seeds = {experiment: int(s.generate_state(1)[0]) for experiment, s in zip(batch, seed_sequence.spawn(size))}
+        event_logs = {experiment: None if event_log_file is None else event_log_file.format(experiment)
+                      for experiment in batch}
+        keys = {experiment: None if cache is None else
+                cache.key(simulation_type, seeds[experiment], iterations, experiment=experiment, **options, **kwargs)
+                for experiment in batch}
+        cached = {experiment: cache.get(keys[experiment]) for experiment in batch if keys[experiment] is not None}
+        pending = [experiment for experiment in batch if cached.get(experiment) is None]
+        group_size = replicates if simulation_type is BatchedSimulation else 1
+        groups = [pending[k:k + group_size] for k in range(0, len(pending), group_size)]
+        group_of = {experiment: k for k, group in enumerate(groups) for experiment in group}
+        SIfiles = {experiment: None if file is None else '{}.part{}'.format(file, experiment) for experiment in batch}
+        arguments = [(group, [seeds[experiment] for experiment in group], iterations, simulation_type,
+                      [event_logs[experiment] for experiment in group], [SIfiles[experiment] for experiment in group])
+                     for group in groups]
+        futures = {}
+
+        results = {}
+        for experiment in batch:
+            if cached.get(experiment) is not None:
+                result = cached[experiment]
+            else:
+                if experiment not in results:
+                    k = group_of[experiment]
+                    if workers > 1:
+                        """The results are taken in order: only the next groups are submitted, not the whole batch"""
+                        for ahead in range(k, min(k + 2 * workers, len(groups))):
+                            if ahead not in futures:
+                                futures[ahead] = executor.submit(run_group, *arguments[ahead], **options, **kwargs)
+                    try:
+                        if workers > 1:
+                            group_results = futures.pop(k).result()
+                        else:
+                            group_results = run_group(*arguments[k], **options, **kwargs)
+                    except Exception as ex:
+                        print("Exception occurred in experiment {} (seed {}): {}".format(
+                            ', '.join(str(e) for e in groups[k]), ', '.join(str(seeds[e]) for e in groups[k]), ex))
+                        group_results = [None] * len(groups[k])
+                        for e in groups[k]:
+                            if SIfiles[e] is not None and os.path.exists(SIfiles[e]):
+                                os.remove(SIfiles[e])
+                    results.update(zip(groups[k], group_results))
+                result = results.pop(experiment)
+                if result is None:
+                    continue
+                if keys[experiment] is not None:
+                    SIdata = result[1]
+                    if isinstance(SIdata, str):
+                        """The cache keeps the text of the part file, which is written back unchanged"""
+                        SIdata = pd.read_csv(SIdata, dtype=str, keep_default_na=False)
+                    cache.put(keys[experiment], (result[0], SIdata) + tuple(result[2:]))
+            experiment_rows, SIdata, experiment_metrics, experiment_aggregator = result
+            rows.extend(experiment_rows)
+            metric_rows.extend(experiment_metrics)
+            if experiment_aggregator is not None:
+                aggregator.merge(experiment_aggregator)
+            if SIdata is not None:
+                _append_SIdata(SIdata, file, written)
+                written = True
+        done += size
+
+        if target_width is not None:
+            widths = confidence_widths(pd.DataFrame(rows), iterations - 1, target_statistics, confidence)
+            if all(width <= target_width for width in widths.values()):
+                print('Confidence intervals after {} experiments: {}'.format(done, widths))
+                break
+
+    if workers > 1:
+        executor.shutdown()
+    if file is not None and not written:
+        pd.DataFrame(columns=list(SI_COLUMNS.keys())).to_csv(file, index=False)
+    df_statistics = pd.DataFrame(rows)
     df_statistics.to_csv(file2, index=False)
+    if metrics_file is not None:
+        pd.DataFrame(metric_rows).to_csv(metrics_file, index=False)
+    if si_summary_file is not None:
+        aggregator.to_frame().to_csv(si_summary_file, index=False)
+    if si_pairs_file is not None:
+        aggregator.pairs_frame().to_csv(si_pairs_file, index=False)
     print(df_statistics)
     return df_statistics
-    
-batch_experiment_SI(experiments = 1, iterations = 100, file='df_SI_never.csv', file2='df_stat_never.csv', 
-                    diagnosis_condition_symptom = '1 == 0', diagnosis_condition_tracing = '1 == 0')
 
 
-batch_experiment_SI(experiments = 1, iterations = 100, file='df_SI_sym3.csv', file2='df_stat_sym3.csv',
-                    diagnosis_condition_symptom = 'agent.time_since_symptom_onset != None and agent.time_since_symptom_onset >= 3', 
-                    diagnosis_condition_tracing = '1 == 0')
+def compare_scenarios(scenarios, file, seed=None, statistics=('Recovered_Immune', 'Death', 'transmission_route_known'),
+                      confidence=0.95):
+    """
+    Execute the batches of several scenarios with common random numbers (see Simulation.common_random_numbers):
+    the simulation k of every scenario has the same seed, hence the same random numbers for the same agents,
+    and the differences of its statistics with the simulation k of the first scenario, the baseline, are paired.
+    Their confidence intervals are narrower than the ones of the differences of independent batches
+
+    :param scenarios: a list of (name, parameters of batch_experiment_SI) tuples, the baseline first; they must have
+    the same number of experiments and iterations, and no target_width
+    :param file: filename to store the paired differences of the statistics by scenario, iteration and experiment
+    :param seed: the seed shared by the batches, None for a random one
+    :param statistics: the names of the compared statistics, see Simulation.get_statistics
+    :param confidence: the confidence level of the intervals
+    :return: a Pandas Dataframe with, for each scenario and statistic, the mean paired difference with the baseline
+    at the last iteration and the widths of its confidence interval, paired and (approximately) as for
+    independent batches
+    """
+    import pandas as pd
+    if seed is None:
+        seed = int(np.random.SeedSequence().generate_state(1)[0])
+    frames = {}
+    for name, parameters in scenarios:
+        if parameters.get('target_width') is not None:
+            raise ValueError("Scenario {}: compared batches cannot use target_width".format(name))
+        frames[name] = batch_experiment_SI(**dict(parameters, seed=seed, common_random_numbers=True))
+    statistics = list(statistics)
+    baseline_name = scenarios[0][0]
+    baseline = frames[baseline_name].set_index(['iteration', 'experiment'])[statistics].astype(float)
+    last = baseline.index.get_level_values('iteration').max()
+    baseline_widths = confidence_widths(frames[baseline_name], last, statistics, confidence)
 
-batch_experiment_SI(experiments = 1, iterations = 100, file='df_SI_sym3DSI3.csv', file2='df_stat_sym3DSI3.csv', 
-                    diagnosis_condition_symptom = 'agent.time_since_symptom_onset != None and agent.time_since_symptom_onset >= 3', 
-                    diagnosis_condition_tracing = 'agent.infector_time_since_diagnosis != None and agent.infector_time_since_diagnosis >= i'
-                    )
-"""
-infector_time_since_diagnosis >= i (i in 0:10)
-"""
+    differences = []
+    rows = []
+    for name, _ in scenarios[1:]:
+        frame = frames[name].set_index(['iteration', 'experiment'])[statistics].astype(float)
+        if not frame.index.equals(baseline.index):
+            raise ValueError("Scenario {} has other experiments or iterations than {}".format(name, baseline_name))
+        difference = (frame - baseline).reset_index()
+        difference.insert(0, 'scenario', name)
+        differences.append(difference)
+        paired = confidence_widths(difference, last, statistics, confidence)
+        widths = confidence_widths(frames[name], last, statistics, confidence)
+        for statistic in statistics:
+            values = difference.loc[difference['iteration'] == last, statistic]
+            rows.append({'scenario': name, 'baseline': baseline_name, 'statistic': statistic,
+                         'experiments': int(values.notna().sum()), 'mean_difference': values.mean(),
+                         'paired_width': paired[statistic],
+                         'independent_width': np.sqrt(widths[statistic] ** 2 + baseline_widths[statistic] ** 2)})
+    if len(differences) == 0:
+        differences = [pd.DataFrame(columns=['scenario', 'iteration', 'experiment'] + statistics)]
+    pd.concat(differences, ignore_index=True).to_csv(file, index=False)
+    summary = pd.DataFrame(rows)
+    print(summary)
+    return summary
+
+
+SIMULATION_TYPES = {'Simulation': Simulation, 'VectorizedSimulation': VectorizedSimulation,
+                    'BatchedSimulation': BatchedSimulation}
+"""The simulation engines which a configuration file can select by name"""
+
+
+def load_scenarios(config):
+    """
+    Read the scenarios of a configuration file: a JSON object with optional "defaults", the parameters shared
+    by all scenarios, and "scenarios", the parameters of batch_experiment_SI (experiments, iterations, file, file2,
+    workers, seed, ...) and of the simulation (population_size, diagnosis_condition_symptom, prob_tracing_missed, ...)
+    of each scenario by name. simulation_type is an engine name in SIMULATION_TYPES and amplitudes are given
+    by Status name.
+
+    A scenario with a "sweep", e.g. {"i": [0, 1, 2]}, is repeated for each combination of the values, which
+    replace {i} in its name and in its string parameters (conditions and filenames). See scenarios.json
+
+    :param config: filename of the configuration file
+    :return: a list of (name, base name, parameters) tuples, one per scenario after the expansion of the sweeps
+    """
+    with open(config) as f:
+        configuration = json.load(f)
+    defaults = configuration.get('defaults', {})
+    scenarios = []
+    for base, parameters in configuration['scenarios'].items():
+        parameters = dict(defaults, **parameters)
+        sweep = parameters.pop('sweep', {})
+        for values in itertools.product(*sweep.values()):
+            values = dict(zip(sweep.keys(), values))
+            scenario = {key: value.format(**values) if isinstance(value, str) and sweep else value
+                        for key, value in parameters.items()}
+            if 'simulation_type' in scenario:
+                if scenario['simulation_type'] not in SIMULATION_TYPES:
+                    raise ValueError("Scenario {}: unknown simulation_type '{}', choose one of {}".format(
+                        base, scenario['simulation_type'], list(SIMULATION_TYPES.keys())))
+                scenario['simulation_type'] = SIMULATION_TYPES[scenario['simulation_type']]
+            if 'amplitudes' in scenario:
+                scenario['amplitudes'] = {Status[status]: amplitude
+                                          for status, amplitude in scenario['amplitudes'].items()}
+            scenarios.append((base.format(**values) if sweep else base, base, scenario))
+    return scenarios
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the scenarios of a configuration file')
+    parser.add_argument('config', help='JSON file with the scenarios, see load_scenarios')
+    parser.add_argument('--scenarios', nargs='+',
+                        help='names or shell patterns of the scenarios to run (after or before the sweep expansion), '
+                             'all by default')
+    parser.add_argument('--workers', type=int, help='number of processes of each batch, replaces the configuration')
+    parser.add_argument('--list', action='store_true', help='list the selected scenarios without running them')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='run the selected scenarios with common random numbers and store their paired '
+                             'differences with the first one in FILE, see compare_scenarios')
+    args = parser.parse_args(argv)
+
+    selected = []
+    for name, base, parameters in load_scenarios(args.config):
+        if args.scenarios is None or any(fnmatch.fnmatchcase(name, pattern) or pattern == base
+                                         for pattern in args.scenarios):
+            selected.append((name, parameters))
+    if args.scenarios is not None and len(selected) == 0:
+        parser.error('no scenario matches {}'.format(args.scenarios))
+
+    for name, parameters in selected:
+        if args.workers is not None:
+            parameters['workers'] = args.workers
+    if args.compare is not None and not args.list:
+        compare_scenarios(selected, args.compare, seed=selected[0][1].get('seed'))
+        return
+
+    for name, parameters in selected:
+        print(name)
+        if args.list:
+            continue
+        batch_experiment_SI(**parameters)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+metrics.py
+instrumentation of Simulation.execute: wall time and event counts per phase and iteration
+"""
+import time
+
+
+class PhaseMetrics(object):
+    """
+    Record, for each iteration of a simulation, the wall time of each phase of execute and the number of
+    contacts, infections and diagnoses. Give an instance to the simulation with the metrics parameter.
+
+    Any object with the same start/phase/count/stop methods can be used instead, e.g. to send the
+    measurements elsewhere; without metrics the simulation does not measure anything.
+    """
+    def __init__(self):
+        self.rows = []
+        '''One dictionary per iteration with the phase times in seconds (<phase>_time) and the event counts'''
+        self._row = None
+        self._last = None
+
+    def start(self, iteration):
+        """
+        Start measuring an iteration
+
+        :param iteration: the number of the iteration, starting from 0
+        """
+        self._row = {'iteration': iteration}
+        self._last = time.perf_counter()
+
+    def phase(self, name):
+        """
+        Close a phase: its time is the time elapsed since the previous phase or the start of the iteration
+
+        :param name: the name of the phase
+        """
+        now = time.perf_counter()
+        self._row[name + '_time'] = self._row.get(name + '_time', 0.0) + now - self._last
+        self._last = now
+
+    def count(self, name, value):
+        """
+        Add events of the iteration
+
+        :param name: the name of the events, e.g. 'infections'
+        :param value: the number of events
+        """
+        self._row[name] = self._row.get(name, 0) + value
+
+    def stop(self):
+        """
+        Finish measuring the iteration
+        """
+        self.rows.append(self._row)
+        self._row = None
+
+    def to_frame(self):
+        """
+        :return: a Pandas Dataframe with one row per iteration
+        """
+        import pandas as pd
+        return pd.DataFrame(self.rows)
@@ -0,0 +1,150 @@
+"""
+policies.py
+diagnosis policies: conditions on an agent, compiled once and evaluated for one agent
+or as a boolean mask over a population in array form
+"""
+import ast
+from functools import lru_cache
+import numpy as np
+from agents import *
+
+
+class _MaskTransformer(ast.NodeTransformer):
+    """
+    Rewrite a condition on one agent into an expression on arrays:
+    and/or/not become element-wise logical operations, comparisons to None become NaN tests
+    and chained comparisons are split into element-wise conjunctions
+    """
+    def _call(self, name, args):
+        return ast.Call(func=ast.Name(id=name, ctx=ast.Load()), args=args, keywords=[])
+
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+        name = '_and' if isinstance(node.op, ast.And) else '_or'
+        result = node.values[0]
+        for value in node.values[1:]:
+            result = self._call(name, [result, value])
+        return result
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            return self._call('_not', [node.operand])
+        return node
+
+    @staticmethod
+    def _is_none(node):
+        return isinstance(node, ast.Constant) and node.value is None
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        terms = []
+        left = node.left
+        for op, right in zip(node.ops, node.comparators):
+            """None can be on either side of the comparison: the other side is tested"""
+            value = left if self._is_none(right) else right if self._is_none(left) else None
+            if value is not None and isinstance(op, (ast.Eq, ast.Is)):
+                terms.append(self._call('_isnan', [value]))
+            elif value is not None and isinstance(op, (ast.NotEq, ast.IsNot)):
+                terms.append(self._call('_notnan', [value]))
+            elif isinstance(op, (ast.Is, ast.IsNot, ast.In, ast.NotIn)):
+                raise ValueError("'{}' is not supported in a vectorized condition".format(type(op).__name__))
+            else:
+                terms.append(ast.Compare(left=left, ops=[op], comparators=[right]))
+            left = right
+        result = terms[0]
+        for term in terms[1:]:
+            result = self._call('_and', [result, term])
+        return result
+
+    def generic_visit(self, node):
+        if isinstance(node, (ast.IfExp, ast.Lambda, ast.comprehension, ast.NamedExpr)):
+            raise ValueError("'{}' is not supported in a vectorized condition".format(type(node).__name__))
+        return super(_MaskTransformer, self).generic_visit(node)
+
+
+class _PopulationView(object):
+    """
+    Attribute access to a population in array form: agent.<attribute> returns the whole column.
+    Enum attributes are returned as arrays of Enum members so they compare with Status.Infected and the like
+    """
+    def __init__(self, columns):
+        self._columns = columns
+
+    def __getattr__(self, name):
+        if name not in self._columns:
+            raise AttributeError(name)
+        if name in AGENT_ENUMS:
+            return np.array(list(AGENT_ENUMS[name]), dtype=object)[self._columns[name]]
+        return self._columns[name]
+
+
+_MASK_FUNCTIONS = {'_and': np.logical_and, '_or': np.logical_or, '_not': np.logical_not,
+                   '_isnan': np.isnan, '_notnan': lambda x: ~np.isnan(x)}
+
+
+class Policy(object):
+    """
+    A diagnosis condition, compiled once.
+    Calling the policy evaluates the condition for one agent; mask() evaluates it for a whole population in
+    array form. Conditions given as functions of one agent are evaluated agent by agent by mask().
+    """
+    def __init__(self, condition, **namespace):
+        """
+        :param condition: a Python expression on `agent` as a string, for instance
+        'agent.time_since_symptom_onset != None and agent.time_since_symptom_onset >= 3',
+        or a function receiving an agents.Agent instance and returning a boolean
+        :param namespace: the values of other names used in the expression (e.g. i=3)
+        """
+        self.condition = condition
+        self.names = namespace
+        self.namespace = dict(globals(), **namespace)
+        self.code = None
+        self.mask_code = None
+        if not callable(condition):
+            self.code = compile(condition, '<diagnosis condition>', 'eval')
+            try:
+                tree = _MaskTransformer().visit(ast.parse(condition, mode='eval'))
+                self.mask_code = compile(ast.fix_missing_locations(tree), '<diagnosis condition>', 'eval')
+            except ValueError:
+                self.mask_code = None
+        self.namespace.update(_MASK_FUNCTIONS)
+
+    def __call__(self, agent):
+        if self.code is None:
+            return self.condition(agent)
+        return eval(self.code, self.namespace, {'agent': agent})
+
+    def mask(self, columns):
+        """
+        Evaluate the condition for every agent of a population in array form.
+        A condition which cannot be evaluated on arrays (e.g. max(agent.x, agent.y)) is evaluated agent by agent,
+        from then on
+
+        :param columns: a dictionary of arrays, as returned by agents.to_columns
+        :return: a boolean array
+        """
+        n = len(columns['id'])
+        if self.mask_code is not None:
+            try:
+                result = eval(self.mask_code, self.namespace, {'agent': _PopulationView(columns)})
+                return np.broadcast_to(np.asarray(result, dtype=bool), (n,)).copy()
+            except Exception:
+                self.mask_code = None
+        return np.array([bool(self(from_columns(columns, i))) for i in range(n)], dtype=bool)
+
+    def __str__(self):
+        return str(self.condition)
+
+
+@lru_cache(maxsize=None)
+def as_policy(condition):
+    """
+    The Policy of a diagnosis condition, compiled on the first request and reused afterwards
+
+    :param condition: a Policy, a condition string or a function of one agent
+    :return: a Policy
+    """
+    if isinstance(condition, Policy):
+        return condition
+    return Policy(condition)
@@ -0,0 +1,96 @@
+"""
+recorder.py
+"""
+import numpy as np
+from abs import *
+
+
+class SIRecorder(object):
+    """
+    Collect the serial interval (SI) data of every iteration in preallocated typed arrays.
+    The arrays hold chunk_size rows; a full chunk is appended to the csv file (or kept as a data frame
+    when there is no file) and the arrays are reused, so memory stays bounded however long the run.
+    """
+    def __init__(self, file=None, chunk_size=100000):
+        """
+        :param file: filename of the csv file receiving the SI data, None to keep it in memory (see to_frame)
+        :param chunk_size: the number of rows held in the arrays before a flush
+        """
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffers = None
+        '''The preallocated arrays, one per agent attribute of agents.SI_COLUMNS and per extra column'''
+        self.rows = 0
+        '''The number of rows filled in the arrays'''
+        self.chunks = []
+        '''The flushed data frames, when there is no file'''
+        self.written = False
+
+    def _allocate(self, columns, extra):
+        self.buffers = {}
+        for attribute in SI_COLUMNS.values():
+            self.buffers[attribute] = np.empty(self.chunk_size, dtype=columns[attribute].dtype)
+        for name, value in extra.items():
+            self.buffers[name] = np.empty(self.chunk_size, dtype=np.asarray(value).dtype)
+
+    def record(self, columns, **extra):
+        """
+        Append the SI data of a population
+
+        :param columns: the population in array form, as returned by Simulation.get_columns
+        :param extra: constant columns added to the rows, e.g. iteration=3
+        """
+        if self.buffers is None:
+            self._allocate(columns, extra)
+        n = len(columns['id'])
+        start = 0
+        while start < n:
+            take = min(n - start, self.chunk_size - self.rows)
+            for attribute in SI_COLUMNS.values():
+                self.buffers[attribute][self.rows:self.rows + take] = columns[attribute][start:start + take]
+            for name, value in extra.items():
+                self.buffers[name][self.rows:self.rows + take] = value
+            self.rows += take
+            start += take
+            if self.rows == self.chunk_size:
+                self.flush()
+
+    def flush(self):
+        """
+        Write the filled rows to the csv file, or keep them as a data frame when there is no file
+        """
+        if self.buffers is None or self.rows == 0:
+            return
+        columns = {name: buffer[:self.rows].copy() for name, buffer in self.buffers.items()}
+        frame = SIdata_frame(columns)
+        for name in self.buffers:
+            if name not in SI_COLUMNS.values():
+                frame[name] = columns[name]
+        if self.file is None:
+            self.chunks.append(frame)
+        else:
+            frame.to_csv(self.file, mode='a' if self.written else 'w', header=not self.written, index=False)
+            self.written = True
+        self.rows = 0
+
+    def close(self):
+        """
+        Flush the remaining rows
+        """
+        self.flush()
+        if self.file is not None and not self.written:
+            import pandas as pd
+            pd.DataFrame(columns=list(SI_COLUMNS.keys())).to_csv(self.file, index=False)
+            self.written = True
+
+    def to_frame(self):
+        """
+        Return the recorded SI data kept in memory
+
+        :return: a Pandas Dataframe with the SI data of all recorded iterations
+        """
+        import pandas as pd
+        self.flush()
+        if len(self.chunks) == 0:
+            return pd.DataFrame(columns=list(SI_COLUMNS.keys()))
+        return pd.concat(self.chunks, ignore_index=True)
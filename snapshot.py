@@ -0,0 +1,260 @@
+"""
+snapshot.py
+save the complete state of a simulation to a binary file, restore it and fork scenarios from it
+"""
+import json
+import numpy as np
+from abs import *
+from vectorized import *
+from batched import *
+
+SNAPSHOT_MAGIC = b'COVIDSIM'
+SNAPSHOT_VERSION = 2
+"""The version of the snapshot format, stored in every file"""
+
+_ALIGNMENT = 64
+
+SNAPSHOT_ENGINES = {'Simulation': Simulation, 'VectorizedSimulation': VectorizedSimulation,
+                    'BatchedSimulation': BatchedSimulation}
+"""The simulation engines which can be restored from the engine name stored in a snapshot"""
+
+_TRANSIENT = ['population', 'columns', 'rng', 'statistics', 'triggers_simulation', 'triggers_population',
+              'triggers_population_vectorized', 'transmissions', 'force_of_infection', 'counters', 'metrics',
+              'active', 'positions', 'observers', 'contact_history', 'streams', 'incubations', 'survival',
+              'rngs', 'replicate_streams']
+"""Simulation attributes which are not stored as attributes: the population, the random number generators
+(rng and the ones of the replicates of a BatchedSimulation) and the contact history are stored on their own,
+the triggers are functions and the other ones are rebuilt from the population"""
+
+_HISTORY_FIELDS = {'history_contact': 'contact', 'history_day': 'day', 'history_next': 'next'}
+"""The fields of the population holding the contacts.ContactHistory of each agent, by ContactHistory array"""
+
+
+def _dtype(incubations=False, history_width=None):
+    fields = [('id', np.int64), ('x', np.float64), ('y', np.float64)]
+    fields += [(name, np.int8) for name in AGENT_ENUMS]
+    fields += [(name, np.float64) for name in AGENT_NUMBERS]
+    if incubations:
+        """With common random numbers, the incubations drawn in advance for each agent"""
+        fields += [('incubations', np.float64)]
+    if history_width is not None:
+        """With contact tracing, the remembered contacts of each agent"""
+        fields += [('history_contact', np.int32, (history_width,)), ('history_day', np.int32, (history_width,)),
+                   ('history_next', np.int64)]
+    return np.dtype(fields)
+
+
+def _encode(name, value):
+    if name == 'amplitudes':
+        return {status.name: amplitude for status, amplitude in value.items()}
+    if isinstance(value, Policy) and not callable(value.condition):
+        return {'policy': value.condition, 'names': value.names}
+    return value
+
+
+def _decode(name, value):
+    if name == 'amplitudes':
+        return {Status[status]: amplitude for status, amplitude in value.items()}
+    if isinstance(value, dict) and 'policy' in value:
+        return Policy(value['policy'], **value['names'])
+    return value
+
+
+def _generator(state):
+    """
+    :param state: the state of the bit generator of a random number generator, see numpy.random.BitGenerator.state
+    :return: a numpy.random.Generator with this state
+    """
+    bit_generator = getattr(np.random, state['bit_generator'])()
+    bit_generator.state = state
+    return np.random.Generator(bit_generator)
+
+
+def _states(generators):
+    """
+    :param generators: None, a random number generator, or a list or dictionary of them
+    :return: the states of their bit generators, in the same structure
+    """
+    if generators is None:
+        return None
+    if isinstance(generators, list):
+        return [_states(generator) for generator in generators]
+    if isinstance(generators, dict):
+        return {name: _states(generator) for name, generator in generators.items()}
+    return generators.bit_generator.state
+
+
+def _restore(states):
+    """
+    :param states: states as returned by _states
+    :return: the random number generators with these states, in the same structure
+    """
+    if states is None:
+        return None
+    if isinstance(states, list):
+        return [_restore(state) for state in states]
+    if 'bit_generator' not in states:
+        return {name: _restore(state) for name, state in states.items()}
+    return _generator(states)
+
+
+def save_snapshot(sim, file):
+    """
+    Save the complete state of a simulation: its population, the state of its random number generators (with
+    common random numbers, the ones of each purpose and the incubations drawn in advance), its contact history
+    and its attributes.
+    Attributes which cannot be stored (functions, e.g. a diagnosis condition given as a function) are listed in
+    the snapshot and must be given again to load_snapshot, as must the triggers.
+
+    The file holds the SNAPSHOT_MAGIC, the SNAPSHOT_VERSION, a JSON header and the population as a
+    structured array, so the population can be memory-mapped without loading the file (see read_snapshot)
+
+    :param sim: a Simulation, VectorizedSimulation or BatchedSimulation instance
+    :param file: filename of the snapshot
+    """
+    columns = sim.get_columns()
+    history = sim.contact_history
+    population = np.zeros(len(columns['id']), dtype=_dtype(sim.incubations is not None,
+                                                            None if history is None else history.width))
+    for name in population.dtype.names:
+        if name == 'incubations':
+            population[name] = sim.incubations
+        elif name in _HISTORY_FIELDS:
+            population[name] = getattr(history, _HISTORY_FIELDS[name])
+        else:
+            population[name] = columns[name]
+
+    attributes = {}
+    unstored = []
+    for name, value in sim.__dict__.items():
+        if name in _TRANSIENT:
+            continue
+        try:
+            attributes[name] = json.loads(json.dumps(_encode(name, value)))
+        except (TypeError, ValueError):
+            unstored.append(name)
+
+    header = {'version': SNAPSHOT_VERSION,
+              'engine': type(sim).__name__,
+              'dtype': population.dtype.descr,
+              'length': len(population),
+              'attributes': attributes,
+              'unstored': unstored,
+              'contact_history': None if history is None else {'width': history.width, 'days': history.window},
+              'rng': sim.rng.bit_generator.state,
+              'streams': _states(sim.streams),
+              'rngs': _states(getattr(sim, 'rngs', None)),
+              'replicate_streams': _states(getattr(sim, 'replicate_streams', None))}
+    header = json.dumps(header).encode('utf-8')
+    offset = len(SNAPSHOT_MAGIC) + 2 + 4 + len(header)
+    offset += -offset % _ALIGNMENT
+
+    with open(file, 'wb') as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(np.uint16(SNAPSHOT_VERSION).tobytes())
+        f.write(np.uint32(len(header)).tobytes())
+        f.write(header)
+        f.write(b'\0' * (offset - f.tell()))
+        f.write(population.tobytes())
+
+
+def read_snapshot(file):
+    """
+    Read a snapshot without loading its population
+
+    :param file: filename of the snapshot
+    :return: the header dictionary and the population as a read-only memory-mapped structured array
+    """
+    with open(file, 'rb') as f:
+        if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            raise ValueError("{} is not a simulation snapshot".format(file))
+        version = int(np.frombuffer(f.read(2), dtype=np.uint16)[0])
+        if version > SNAPSHOT_VERSION:
+            raise ValueError("{} has snapshot version {}, this code reads up to version {}".format(
+                file, version, SNAPSHOT_VERSION))
+        length = int(np.frombuffer(f.read(4), dtype=np.uint32)[0])
+        header = json.loads(f.read(length).decode('utf-8'))
+        offset = f.tell() + (-f.tell() % _ALIGNMENT)
+    dtype = np.dtype([tuple(field) for field in header['dtype']])
+    population = np.memmap(file, dtype=dtype, mode='r', offset=offset, shape=(header['length'],))
+    return header, population
+
+
+def load_snapshot(file, simulation_type=None, **kwargs):
+    """
+    Restore a simulation from a snapshot
+
+    :param file: filename of the snapshot
+    :param simulation_type: the simulation engine, by default the one that saved the snapshot (see SNAPSHOT_ENGINES)
+    :param kwargs: parameters of the simulation replacing the stored ones, the ones which could not be stored
+    (see save_snapshot) and the triggers; with a seed, seeds or rng parameter the random numbers start afresh
+    instead of from the stored state
+    :return: the restored simulation
+    """
+    header, population = read_snapshot(file)
+    missing = [name for name in header.get('unstored', []) if name not in kwargs]
+    if missing:
+        raise ValueError("{} could not be stored in {}, give them to load_snapshot".format(missing, file))
+    if simulation_type is None:
+        if header['engine'] not in SNAPSHOT_ENGINES:
+            raise ValueError("{} was saved by the unknown engine '{}', give its simulation_type".format(
+                file, header['engine']))
+        simulation_type = SNAPSHOT_ENGINES[header['engine']]
+    attributes = {name: _decode(name, value) for name, value in header['attributes'].items()}
+
+    sim = simulation_type(**dict(attributes, **kwargs))
+    for name, value in attributes.items():
+        if name not in kwargs:
+            sim.__dict__[name] = value
+
+    columns = {name: np.array(population[name]) for name in population.dtype.names}
+    incubations = columns.pop('incubations', None)
+    history = {field: columns.pop(name) for name, field in _HISTORY_FIELDS.items() if name in columns}
+    if 'mobility' not in columns:
+        """Snapshots written before the mobility attribute"""
+        columns['mobility'] = np.ones(len(population))
+    if 'contact_time_since_diagnosis' not in columns:
+        columns['contact_time_since_diagnosis'] = np.full(len(population), np.nan)
+    sim.set_columns(columns)
+
+    """
+    The random number generators are restored after the population: with common random numbers, set_columns
+    draws new incubations, which are replaced by the stored ones
+    """
+    if 'seed' not in kwargs and 'rng' not in kwargs:
+        sim.rng = _generator(header['rng'])
+        if sim.common_random_numbers:
+            if header.get('streams') is not None:
+                sim.streams = _restore(header['streams'])
+            else:
+                sim.streams = dict(zip(RANDOM_STREAMS, sim.rng.spawn(len(RANDOM_STREAMS))))
+    if isinstance(sim, BatchedSimulation) and not any(name in kwargs for name in ('seed', 'seeds', 'rng')):
+        if header.get('rngs') is None or len(header['rngs']) != sim.replicates:
+            raise ValueError("{} does not hold the random number generators of {} replicates".format(
+                file, sim.replicates))
+        sim.rngs = _restore(header['rngs'])
+        if sim.common_random_numbers and header.get('replicate_streams') is not None:
+            sim.replicate_streams = _restore(header['replicate_streams'])
+    if sim.common_random_numbers and incubations is not None and not any(
+            name in kwargs for name in ('seed', 'seeds', 'rng')):
+        sim.incubations = incubations
+    if header.get('contact_history') is not None and sim.contact_tracing_days is not None:
+        """The lookback window follows contact_tracing_days, which a fork can change"""
+        sim.contact_history = ContactHistory(len(population), header['contact_history']['width'],
+                                             sim.contact_tracing_days)
+        for field, values in history.items():
+            setattr(sim.contact_history, field, values.astype(getattr(sim.contact_history, field).dtype))
+    return sim
+
+
+def fork_snapshot(file, scenarios, simulation_type=None):
+    """
+    Restore one simulation per scenario from a shared snapshot, e.g. the end of a burn-in period
+
+    :param file: filename of the snapshot
+    :param scenarios: a list of dictionaries of parameters, one per scenario (see load_snapshot);
+    scenarios without a seed continue with the same random numbers
+    :param simulation_type: the simulation engine, by default the one that saved the snapshot
+    :return: a list with the restored simulations
+    """
+    return [load_snapshot(file, simulation_type, **scenario) for scenario in scenarios]
@@ -0,0 +1,48 @@
+"""
+test_agents.py
+the population in array form
+"""
+import numpy as np
+from abs import *
+
+
+def population():
+    sim = Simulation(population_size=200, initial_infected_perc=0.05, seed=8,
+                     diagnosis_condition_symptom='agent.time_since_symptom_onset != None and '
+                                                 'agent.time_since_symptom_onset >= 2')
+    sim.initialize()
+    for day in range(20):
+        sim.execute()
+    return sim.get_population()
+
+
+def test_lazy_columns_are_the_columns():
+    agents = population()
+    columns = to_columns(agents)
+    lazy = LazyColumns(agents)
+    for name in COLUMNS:
+        assert name in lazy
+        assert lazy[name].dtype == columns[name].dtype
+        assert np.array_equal(lazy[name], columns[name], equal_nan=True)
+    assert 'unknown' not in lazy
+
+
+def test_lazy_columns_build_the_read_columns_only():
+    lazy = LazyColumns(population())
+    lazy['status']
+    lazy['mobility'] = np.zeros(len(lazy.population))
+    assert sorted(dict.keys(lazy)) == ['mobility', 'status']
+
+
+def test_vectorized_triggers_change_the_masked_agents():
+    sim = Simulation(population_size=200, initial_infected_perc=0.1, seed=8, check_counters=True)
+    sim.append_trigger_population_vectorized(lambda c: c['status'] == code(Status.Infected),
+                                             'mobility', lambda values: 0.0)
+    sim.initialize()
+    for day in range(10):
+        sim.execute()
+        sim.get_statistics()
+    """The agents infected in the last iteration were not infected yet when the triggers were evaluated"""
+    mobility = {a.id: a.mobility for a in sim.population
+                if a.status == Status.Infected and a.time_since_infection > 0}
+    assert len(mobility) > 0 and set(mobility.values()) == {0.0}
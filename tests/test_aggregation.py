@@ -0,0 +1,55 @@
+"""
+test_aggregation.py
+the SI distributions aggregated online against the ones computed from the final SI data
+"""
+from collections import Counter
+import numpy as np
+import pytest
+from vectorized import *
+from aggregation import *
+
+PARAMETERS = {'population_size': 400, 'initial_infected_perc': 0.05,
+              'diagnosis_condition_symptom': 'agent.time_since_symptom_onset != None and '
+                                             'agent.time_since_symptom_onset >= 3',
+              'diagnosis_condition_tracing': 'agent.infector_time_since_diagnosis != None and '
+                                             'agent.infector_time_since_diagnosis >= 1'}
+
+
+def histogram(values):
+    values = np.asarray(values, dtype=float)
+    return Counter(np.floor(values[~np.isnan(values)]).astype(np.int64).tolist())
+
+
+@pytest.mark.parametrize('simulation_type', [Simulation, VectorizedSimulation])
+def test_online_histograms_match_the_SI_data(simulation_type):
+    aggregator = SIAggregator()
+    sim = simulation_type(seed=4, observers=[aggregator], **PARAMETERS)
+    sim.initialize()
+    for day in range(40):
+        sim.execute()
+    c = sim.get_columns()
+
+    assert sum(aggregator.histograms['TSI'].values()) > 10
+    assert aggregator.histograms['TSI'] == histogram(c['TSI'])
+    assert aggregator.histograms['infector_incubation'] == histogram(c['infector_incubation'])
+    assert aggregator.histograms['COSI'] == histogram(c['incubation'] + c['TSI'] - c['infector_incubation'])
+    diagnosed = c['diagnosis_status'] == code(Diagnosis.Diagnosed)
+    assert aggregator.histograms['transmission_route_known'] == histogram(c['transmission_route_known'][diagnosed])
+
+    infected = ~np.isnan(c['TSI'])
+    pairs = np.floor(np.column_stack((c['TSI'], c['infector_incubation'], c['incubation']))[infected])
+    assert aggregator.pairs == Counter(map(tuple, pairs.astype(np.int64).tolist()))
+    assert aggregator.pairs_frame()['count'].sum() == infected.sum()
+
+
+def test_merge_adds_the_simulations():
+    aggregators = [SIAggregator() for _ in range(2)]
+    for seed, aggregator in enumerate(aggregators):
+        sim = Simulation(seed=seed, observers=[aggregator], **PARAMETERS)
+        sim.initialize()
+        for day in range(20):
+            sim.execute()
+    merged = SIAggregator().merge(aggregators[0]).merge(aggregators[1])
+    for quantity in SI_QUANTITIES:
+        assert merged.histograms[quantity] == aggregators[0].histograms[quantity] + aggregators[1].histograms[quantity]
+    assert merged.pairs == aggregators[0].pairs + aggregators[1].pairs
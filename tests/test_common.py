@@ -0,0 +1,30 @@
+"""
+test_common.py
+the tabulated curves against the exact functions
+"""
+import numpy as np
+import pytest
+from abs import *
+
+DAYS = np.linspace(-40, 60, 100001)
+
+
+@pytest.mark.parametrize('curve, exact', [(infectiousness_curve, infectiousness),
+                                          (detectability_curve, detectability)])
+def test_curve_matches_exact_pdf(curve, exact):
+    assert np.max(np.abs(curve(DAYS) - exact(DAYS))) < 1e-5
+    for t in [-30.0, -4.2, 0.0, 1.5, 2.71, 8.0, 45.0]:
+        assert np.isscalar(curve(t)) or np.ndim(curve(t)) == 0
+        assert abs(curve(t) - exact(t)) < 1e-5
+
+
+def test_force_of_infection_follows_direct_contacts():
+    sim = Simulation(seed=1)
+    infector = Agent(x=0, y=0, status=Status.Infected, id=1)
+    infector.incubation = 5
+    sim.set_population([infector] + [Agent(x=0, y=0, status=Status.Susceptible, id=k) for k in (2, 3)])
+
+    infector.time_since_infection = 0
+    assert not sim.contact(sim.population[1], infector, contagion_test=SAR * infectiousness(-5) + 1e-3)
+    infector.time_since_infection = 5
+    assert sim.contact(sim.population[2], infector, contagion_test=SAR * infectiousness(0) - 1e-3)
@@ -0,0 +1,74 @@
+"""
+test_contacts.py
+the contact detection backends against the brute-force reference
+"""
+import numpy as np
+import pytest
+from abs import *
+
+
+def assert_same_pairs(expected, found):
+    assert np.array_equal(expected[0], found[0])
+    assert np.array_equal(expected[1], found[1])
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('contagion_distance', [0.5, 1.0, 3.0])
+def test_grid_matches_bruteforce(seed, contagion_distance):
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(0, 60, 1000)
+    y = rng.uniform(0, 60, 1000)
+    assert_same_pairs(bruteforce_contacts(x, y, contagion_distance), grid_contacts(x, y, contagion_distance))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_grid_matches_bruteforce_on_integer_positions(seed):
+    """Agents move by integer steps, so many pairs are exactly contagion_distance apart"""
+    rng = np.random.default_rng(seed)
+    x = rng.integers(0, 30, 800).astype(float)
+    y = rng.integers(0, 30, 800).astype(float)
+    expected = bruteforce_contacts(x, y, 1.0)
+    assert np.any(np.hypot(x[expected[0]] - x[expected[1]], y[expected[0]] - y[expected[1]]) == 1.0)
+    assert_same_pairs(expected, grid_contacts(x, y, 1.0))
+
+
+def test_grid_on_small_populations():
+    assert_same_pairs(bruteforce_contacts([], [], 1.0), grid_contacts([], [], 1.0))
+    assert_same_pairs(bruteforce_contacts([1.0], [1.0], 1.0), grid_contacts([1.0], [1.0], 1.0))
+    assert_same_pairs(bruteforce_contacts([0.0, 1.0], [0.0, 0.0], 1.0), grid_contacts([0.0, 1.0], [0.0, 0.0], 1.0))
+
+
+def test_seeded_runs_match_bruteforce():
+    statistics = {}
+    for backend in ['bruteforce', 'grid']:
+        sim = Simulation(population_size=300, initial_infected_perc=0.05, contact_detection=backend, seed=11)
+        sim.initialize()
+        for day in range(20):
+            sim.execute()
+        statistics[backend] = (sim.get_statistics(), sim.get_positions(), sim.get_transmission_tree())
+    assert statistics['bruteforce'] == statistics['grid']
+
+
+def test_tiled_matches_grid():
+    rng = np.random.default_rng(3)
+    x = rng.uniform(0, 60, 3000)
+    y = rng.uniform(0, 60, 3000)
+    tiled = TiledContacts(workers=2, tiles=(3, 2), min_size=0)
+    try:
+        assert_same_pairs(grid_contacts(x, y, 1.0), tiled(x, y, 1.0))
+    finally:
+        tiled.close()
+    assert tiled.executor is None
+
+
+def test_tiled_backend_follows_the_worker_budget():
+    try:
+        set_contact_workers(3)
+        backend = contact_backend('tiled')
+        assert backend is contact_backend('tiled')
+        assert backend.workers == 3
+        set_contact_workers(1)
+        assert contact_backend('tiled') is not backend
+        assert contact_backend('tiled').workers == 1
+    finally:
+        set_contact_workers(None)
@@ -0,0 +1,70 @@
+"""
+test_counters.py
+the running population counters of Simulation against a full recount
+"""
+import copy
+import pytest
+from abs import *
+
+SYMPTOM = 'agent.time_since_symptom_onset != None and agent.time_since_symptom_onset >= 2'
+TRACING = 'agent.infector_time_since_diagnosis != None and agent.infector_time_since_diagnosis >= 0'
+
+
+def checked_simulation(seed, **kwargs):
+    sim = Simulation(population_size=300, initial_infected_perc=0.05, initial_immune_perc=0.05, seed=seed,
+                     diagnosis_condition_symptom=SYMPTOM, diagnosis_condition_tracing=TRACING,
+                     contact_tracing_days=5, quarantine_contacts=True, check_counters=True, **kwargs)
+    sim.initialize()
+    return sim
+
+
+def run(sim, iterations):
+    for day in range(iterations):
+        sim.execute()
+        sim.get_statistics()
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_counters_follow_the_population(seed):
+    sim = checked_simulation(seed)
+    run(sim, 40)
+    statistics = sim.get_statistics()
+    assert statistics['Susceptible'] < 0.9
+    assert statistics['Isolated'] > 0 or statistics['transmission_route_known'] > 0
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_counters_follow_the_triggers(seed):
+    sim = checked_simulation(seed)
+    sim.append_trigger_population(lambda agent: (agent.time_since_infection == 4 and
+                                                 agent.transmission_route_known is None),
+                                  'transmission_route_known', lambda value: 1)
+    sim.append_trigger_population(lambda agent: agent.time_since_infection == 30,
+                                  'status', lambda value: Status.Recovered_Immune)
+    sim.append_trigger_population_vectorized(lambda c: c['symptom_status'] == code(Symptom.Symptomatic),
+                                             'mobility', lambda values: 0.0)
+    sim.append_trigger_population_vectorized(lambda c: c['time_since_isolation_start'] == 20,
+                                             'isolation_status', lambda values: code(Isolation.No_Isolation))
+    sim.append_trigger_simulation(lambda s: s.iteration == 10, 'contagion_distance', lambda value: 2 * value)
+    run(sim, 40)
+
+
+def test_counters_after_set_population():
+    sim = checked_simulation(4)
+    run(sim, 15)
+    population = copy.deepcopy(sim.get_population())
+    for agent in population[::7]:
+        if agent.status == Status.Susceptible:
+            agent.status = Status.Recovered_Immune
+    sim.set_population(population)
+    sim.get_statistics()
+    run(sim, 15)
+
+
+def test_drift_is_detected():
+    sim = checked_simulation(5)
+    run(sim, 5)
+    next(a for a in sim.population if a.status == Status.Susceptible).status = Status.Recovered_Immune
+    sim.statistics = None
+    with pytest.raises(RuntimeError, match='drifted'):
+        sim.get_statistics()
@@ -0,0 +1,48 @@
+"""
+test_events.py
+the population rebuilt from an event log against the one of the simulation
+"""
+import numpy as np
+import pytest
+from vectorized import *
+from events import *
+
+SYMPTOM = 'agent.time_since_symptom_onset != None and agent.time_since_symptom_onset >= 3'
+TRACING = 'agent.infector_time_since_diagnosis != None and agent.infector_time_since_diagnosis >= 1'
+
+NOT_LOGGED = ['x', 'y', 'mobility', 'contact_time_since_diagnosis']
+"""The attributes which the event log does not rebuild, see EventLogReader.get_columns"""
+
+SCENARIOS = {'symptom': {'diagnosis_condition_symptom': SYMPTOM},
+             'tracing': {'diagnosis_condition_symptom': SYMPTOM, 'diagnosis_condition_tracing': TRACING},
+             'quarantine': {'diagnosis_condition_symptom': SYMPTOM, 'diagnosis_condition_tracing': TRACING,
+                            'contact_tracing_days': 5, 'quarantine_contacts': True}}
+
+
+@pytest.mark.parametrize('scenario', sorted(SCENARIOS))
+@pytest.mark.parametrize('simulation_type', [Simulation, VectorizedSimulation])
+def test_reader_rebuilds_the_population(tmp_path, simulation_type, scenario):
+    file = str(tmp_path / 'events.log')
+    sim = simulation_type(population_size=300, initial_infected_perc=0.05, initial_immune_perc=0.02, seed=6,
+                          **SCENARIOS[scenario])
+    log = EventLog(file, sim, chunk_size=64)
+    sim.observers = [log]
+    sim.initialize()
+    expected = {}
+    for day in range(45):
+        sim.execute()
+        if day % 5 == 4:
+            expected[day] = {name: np.array(column, dtype=float) for name, column in sim.get_columns().items()}
+    log.close()
+
+    reader = EventLogReader(file)
+    tree = [(int(infector), int(agent)) for infector, agent in zip(expected[44]['infector'], expected[44]['id'])
+            if not np.isnan(infector)]
+    assert sorted(reader.get_transmission_tree()) == sorted(tree)
+    for day, columns in expected.items():
+        rebuilt = reader.get_columns(day)
+        for name in columns:
+            if name in NOT_LOGGED:
+                continue
+            assert np.array_equal(np.asarray(rebuilt[name], dtype=float), columns[name], equal_nan=True), (day, name)
+    assert expected[44]['diagnosis_status'].sum() > 0
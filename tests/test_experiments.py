@@ -0,0 +1,147 @@
+"""
+test_experiments.py
+batches of simulations
+"""
+import copy
+import json
+import os
+import pandas as pd
+import pytest
+from experiments import *
+
+PARAMETERS = {'population_size': 150, 'initial_infected_perc': 0.05,
+              'diagnosis_condition_symptom': 'agent.time_since_symptom_onset != None and '
+                                             'agent.time_since_symptom_onset >= 3'}
+
+LATE_DIAGNOSIS = 'agent.time_since_symptom_onset != None and agent.time_since_symptom_onset >= 8'
+
+
+def run_batch(directory, name, **kwargs):
+    file = os.path.join(str(directory), 'df_SI_{}.csv'.format(name))
+    batch_experiment_SI(4, 10, file, os.path.join(str(directory), 'df_stat_{}.csv'.format(name)), seed=5,
+                        **dict(PARAMETERS, **kwargs))
+    with open(file) as f:
+        return f.read()
+
+
+def test_parallel_batch_streams_the_same_SI_data(tmp_path):
+    serial = run_batch(tmp_path, 'serial')
+    assert serial == run_batch(tmp_path, 'parallel', workers=2)
+    assert serial == run_batch(tmp_path, 'cached', workers=2, cache=str(tmp_path / 'cache'))
+    assert serial == run_batch(tmp_path, 'from_cache', cache=str(tmp_path / 'cache'))
+    assert len(serial.splitlines()) == 1 + 4 * 10 * PARAMETERS['population_size']
+    assert not [name for name in os.listdir(str(tmp_path)) if '.part' in name]
+
+
+def write_config(directory, scenarios):
+    config = os.path.join(str(directory), 'scenarios.json')
+    with open(config, 'w') as f:
+        json.dump({'defaults': {'experiments': 1, 'iterations': 5}, 'scenarios': scenarios}, f)
+    return config
+
+
+def test_load_scenarios_expands_sweeps_and_engines(tmp_path):
+    config = write_config(tmp_path, {'sym{i}': {'sweep': {'i': [1, 2]}, 'simulation_type': 'VectorizedSimulation',
+                                                'file': 'df_SI_sym{i}.csv',
+                                                'amplitudes': {'Susceptible': 2.0, 'Infected': 1.0}}})
+    scenarios = load_scenarios(config)
+    assert [(name, base) for name, base, _ in scenarios] == [('sym1', 'sym{i}'), ('sym2', 'sym{i}')]
+    parameters = scenarios[1][2]
+    assert parameters['simulation_type'] is VectorizedSimulation
+    assert parameters['file'] == 'df_SI_sym2.csv'
+    assert parameters['amplitudes'] == {Status.Susceptible: 2.0, Status.Infected: 1.0}
+
+
+def test_load_scenarios_rejects_unknown_engines(tmp_path):
+    for name in ['ProcessPoolExecutor', 'Status', 'NoSuchSimulation']:
+        with pytest.raises(ValueError, match='unknown simulation_type'):
+            load_scenarios(write_config(tmp_path, {'never': {'simulation_type': name}}))
+
+
+def test_adaptive_replication_stops_at_the_target_width(tmp_path):
+    target = 0.012
+    statistics = batch_experiment_SI(40, 15, None, str(tmp_path / 'df_stat.csv'), seed=2, target_width=target,
+                                     target_statistics=('Susceptible',), min_experiments=3, **PARAMETERS)
+    done = statistics['experiment'].nunique()
+    assert 3 < done < 40
+    assert confidence_widths(statistics, 14, ['Susceptible'])['Susceptible'] <= target
+    before = statistics[statistics['experiment'] < done - 1]
+    assert confidence_widths(before, 14, ['Susceptible'])['Susceptible'] > target
+
+
+def test_adaptive_replication_runs_every_experiment_without_convergence(tmp_path):
+    statistics = batch_experiment_SI(6, 10, None, str(tmp_path / 'df_stat.csv'), seed=2, target_width=1e-9,
+                                     target_statistics=('Susceptible',), min_experiments=3, **PARAMETERS)
+    assert statistics['experiment'].nunique() == 6
+
+
+@pytest.mark.parametrize('simulation_type', [Simulation, VectorizedSimulation])
+def test_fast_forward_gives_the_statistics_of_execute(simulation_type):
+    parameters = dict(PARAMETERS, population_size=200, initial_infected_perc=0.02)
+    stepped, forwarded = [run_experiment(0, 3, 120, simulation_type, stop_at_extinction=stop, **parameters)
+                          for stop in (False, True)]
+    assert stepped[0][-1]['Infected'] == 0 and stepped[0][-1]['Isolated'] == 0
+    assert stepped[0] == forwarded[0]
+    columns = [frame.drop(columns=['x', 'y'], errors='ignore') for frame in (stepped[1], forwarded[1])]
+    assert columns[0].equals(columns[1])
+
+
+def test_fast_forward_by_several_days():
+    sim = Simulation(seed=3, **dict(PARAMETERS, population_size=200, initial_infected_perc=0.02))
+    sim.initialize()
+    while not sim.is_extinct():
+        sim.execute()
+    reference = copy.deepcopy(sim)
+    for day in range(30):
+        reference.execute()
+    sim.fast_forward(30)
+    assert sim.iteration == reference.iteration
+    assert sim.get_statistics() == reference.get_statistics()
+    for name in TIMERS:
+        assert np.array_equal(sim.get_columns()[name], reference.get_columns()[name], equal_nan=True)
+
+
+@pytest.mark.parametrize('simulation_type', [Simulation, VectorizedSimulation])
+def test_common_random_numbers_are_shared_by_the_scenarios(simulation_type):
+    """The scenarios stay identical until their first diagnosis, and draw the same numbers of each purpose after"""
+    parameters = dict(PARAMETERS, population_size=300, seed=7, common_random_numbers=True)
+    early = simulation_type(**parameters)
+    late = simulation_type(**dict(parameters, diagnosis_condition_symptom=LATE_DIAGNOSIS))
+    early.initialize()
+    late.initialize()
+    assert np.array_equal(early.incubations, late.incubations)
+    differ = False
+    for day in range(20):
+        early.execute()
+        late.execute()
+        first, second = early.get_columns(), late.get_columns()
+        differ = differ or np.any(first['diagnosis_status'] == DIAGNOSED)
+        if not differ:
+            for name in first:
+                assert np.array_equal(np.asarray(first[name], dtype=float), np.asarray(second[name], dtype=float),
+                                      equal_nan=True), (day, name)
+        for purpose in RANDOM_STREAMS:
+            assert early.stream(purpose).bit_generator.state == late.stream(purpose).bit_generator.state
+    assert differ and not np.array_equal(first['diagnosis_status'], second['diagnosis_status'])
+    both = (first['status'] != SUSCEPTIBLE) & (second['status'] != SUSCEPTIBLE)
+    assert np.array_equal(first['incubation'][both], second['incubation'][both])
+
+
+def test_compare_scenarios_pairs_the_experiments(tmp_path):
+    scenarios = [(name, dict(PARAMETERS, experiments=4, iterations=12, file=None,
+                             file2=str(tmp_path / 'df_stat_{}.csv'.format(name)), **condition))
+                 for name, condition in [('symptom', {}), ('late', {'diagnosis_condition_symptom': LATE_DIAGNOSIS})]]
+    statistics = ['Recovered_Immune', 'Infected']
+    summary = compare_scenarios(scenarios, str(tmp_path / 'differences.csv'), seed=5, statistics=statistics)
+    frames = {name: batch_experiment_SI(**dict(parameters, seed=5, common_random_numbers=True))
+              .set_index(['iteration', 'experiment'])[statistics].astype(float)
+              for name, parameters in scenarios}
+    differences = pd.read_csv(str(tmp_path / 'differences.csv')).set_index(['iteration', 'experiment'])
+    assert len(differences) == 4 * 12 and set(differences['scenario']) == {'late'}
+    expected = (frames['late'] - frames['symptom']).loc[differences.index]
+    assert np.allclose(differences[statistics].values, expected.values)
+    last = expected.loc[11]
+    for statistic in statistics:
+        row = summary[summary['statistic'] == statistic].iloc[0]
+        assert row['experiments'] == 4
+        assert np.isclose(row['mean_difference'], last[statistic].mean())
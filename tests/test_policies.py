@@ -0,0 +1,63 @@
+"""
+test_policies.py
+diagnosis policies evaluated on a population in array form against one agent at a time
+"""
+import json
+import os
+import numpy as np
+import pytest
+from abs import *
+
+
+def shipped_conditions():
+    with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scenarios.json')) as f:
+        scenarios = json.load(f)['scenarios']
+    conditions = set()
+    for parameters in scenarios.values():
+        for i in parameters.get('sweep', {}).get('i', [None]):
+            for name in ['diagnosis_condition_symptom', 'diagnosis_condition_tracing']:
+                conditions.add(parameters[name] if i is None else parameters[name].format(i=i))
+    return sorted(conditions)
+
+
+EDGE_CASES = ['None != agent.time_since_diagnosis',
+              'None == agent.infector_time_since_diagnosis',
+              'agent.time_since_diagnosis is not None and None is not agent.time_since_symptom_onset',
+              'agent.time_since_infection != None and 0 <= agent.time_since_infection - agent.incubation < 5',
+              '10 < agent.x <= agent.y < 50',
+              'not agent.time_since_symptom_onset != None or agent.status == Status.Infected',
+              'agent.isolation_status == Isolation.Isolated and not (agent.x > 30 or agent.y > 30)',
+              'abs(agent.x - agent.y) < 10',
+              'max(agent.x, agent.y) > 30',
+              'round(agent.x) % 2 == 0',
+              '1 == 0']
+
+
+@pytest.fixture(scope='module')
+def columns():
+    sim = Simulation(population_size=400, initial_infected_perc=0.05, seed=2,
+                     diagnosis_condition_symptom=shipped_conditions()[-1],
+                     diagnosis_condition_tracing=shipped_conditions()[0])
+    sim.initialize()
+    for day in range(25):
+        sim.execute()
+    return sim.get_columns()
+
+
+@pytest.mark.parametrize('condition', shipped_conditions() + EDGE_CASES)
+def test_mask_matches_one_agent_at_a_time(columns, condition):
+    policy = Policy(condition)
+    expected = np.array([bool(policy(from_columns(columns, i))) for i in range(len(columns['id']))])
+    assert np.array_equal(policy.mask(columns), expected)
+    assert np.array_equal(policy.mask(columns), expected)
+
+
+def test_shipped_conditions_are_vectorized():
+    for condition in shipped_conditions():
+        assert Policy(condition).mask_code is not None
+
+
+def test_named_values(columns):
+    policy = Policy('agent.infector_time_since_diagnosis != None and agent.infector_time_since_diagnosis >= i', i=2)
+    expected = [bool(policy(from_columns(columns, i))) for i in range(len(columns['id']))]
+    assert policy.mask(columns).tolist() == expected
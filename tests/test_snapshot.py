@@ -0,0 +1,119 @@
+"""
+test_snapshot.py
+saving, restoring and forking simulations
+"""
+import numpy as np
+import pytest
+from snapshot import *
+
+SYMPTOM = 'agent.time_since_symptom_onset != None and agent.time_since_symptom_onset >= 3'
+TRACING = 'agent.infector_time_since_diagnosis != None and agent.infector_time_since_diagnosis >= i'
+
+
+def run(sim, iterations):
+    for day in range(iterations):
+        sim.execute()
+    return sim
+
+
+def state(sim):
+    columns = sim.get_columns()
+    return {name: np.asarray(columns[name], dtype=float) for name in ['x', 'y', 'status', 'incubation', 'infector']}
+
+
+def assert_same_state(first, second):
+    a, b = state(first), state(second)
+    for name in a:
+        assert np.array_equal(a[name], b[name], equal_nan=True), name
+
+
+@pytest.mark.parametrize('common_random_numbers', [False, True])
+@pytest.mark.parametrize('simulation_type', [Simulation, VectorizedSimulation])
+def test_restore_continues_the_run(tmp_path, simulation_type, common_random_numbers):
+    parameters = {'population_size': 300, 'initial_infected_perc': 0.05, 'seed': 7,
+                  'diagnosis_condition_symptom': SYMPTOM, 'common_random_numbers': common_random_numbers}
+    reference = simulation_type(**parameters)
+    reference.initialize()
+    run(reference, 10)
+    save_snapshot(reference, str(tmp_path / 'day10.snap'))
+    restored = load_snapshot(str(tmp_path / 'day10.snap'))
+    assert type(restored) is simulation_type
+    assert_same_state(run(reference, 10), run(restored, 10))
+
+
+@pytest.mark.parametrize('simulation_type', [Simulation, VectorizedSimulation])
+def test_restore_continues_the_contact_tracing(tmp_path, simulation_type):
+    parameters = {'population_size': 300, 'initial_infected_perc': 0.05, 'seed': 7,
+                  'diagnosis_condition_symptom': SYMPTOM, 'contact_tracing_days': 7, 'contact_history_width': 8,
+                  'quarantine_contacts': True}
+    reference = simulation_type(**parameters)
+    reference.initialize()
+    run(reference, 10)
+    save_snapshot(reference, str(tmp_path / 'tracing.snap'))
+    restored = load_snapshot(str(tmp_path / 'tracing.snap'))
+    for name in ['contact', 'day', 'next']:
+        assert np.array_equal(getattr(restored.contact_history, name), getattr(reference.contact_history, name))
+    run(reference, 15)
+    run(restored, 15)
+    assert_same_state(reference, restored)
+    for name in ['isolation_status', 'time_since_isolation_start', 'contact_time_since_diagnosis',
+                 'transmission_route_known']:
+        assert np.array_equal(np.asarray(reference.get_columns()[name], dtype=float),
+                              np.asarray(restored.get_columns()[name], dtype=float), equal_nan=True), name
+    assert np.nansum(reference.get_columns()['contact_time_since_diagnosis'] >= 0) > 0
+
+
+@pytest.mark.parametrize('common_random_numbers', [False, True])
+def test_restore_continues_a_batch(tmp_path, common_random_numbers):
+    reference = BatchedSimulation(population_size=200, initial_infected_perc=0.05, replicates=3, seed=7,
+                                  diagnosis_condition_symptom=SYMPTOM, common_random_numbers=common_random_numbers)
+    reference.initialize()
+    run(reference, 10)
+    save_snapshot(reference, str(tmp_path / 'batch.snap'))
+    restored = load_snapshot(str(tmp_path / 'batch.snap'))
+    assert type(restored) is BatchedSimulation and restored.replicates == 3
+    assert_same_state(run(reference, 10), run(restored, 10))
+
+
+@pytest.mark.parametrize('simulation_type', [Simulation, VectorizedSimulation])
+def test_forks_share_the_random_numbers(tmp_path, simulation_type):
+    sim = simulation_type(population_size=300, initial_infected_perc=0.05, seed=7, common_random_numbers=True)
+    sim.initialize()
+    run(sim, 5)
+    save_snapshot(sim, str(tmp_path / 'burn_in.snap'))
+    first, second = fork_snapshot(str(tmp_path / 'burn_in.snap'), [{}, {}])
+    assert np.array_equal(first.incubations, sim.incubations)
+    assert_same_state(run(first, 15), run(second, 15))
+
+
+def test_unknown_engine_is_rejected(tmp_path):
+    class CustomSimulation(Simulation):
+        pass
+
+    sim = CustomSimulation(seed=1)
+    sim.initialize()
+    save_snapshot(sim, str(tmp_path / 'custom.snap'))
+    with pytest.raises(ValueError, match='CustomSimulation'):
+        load_snapshot(str(tmp_path / 'custom.snap'))
+    assert type(load_snapshot(str(tmp_path / 'custom.snap'), CustomSimulation)) is CustomSimulation
+
+
+def test_policy_with_names_is_restored(tmp_path):
+    sim = Simulation(seed=1, diagnosis_condition_tracing=Policy(TRACING, i=3))
+    sim.initialize()
+    save_snapshot(sim, str(tmp_path / 'policy.snap'))
+    restored = load_snapshot(str(tmp_path / 'policy.snap'))
+    assert isinstance(restored.diagnosis_condition_tracing, Policy)
+    assert restored.diagnosis_condition_tracing.condition == TRACING
+    assert restored.diagnosis_condition_tracing.names == {'i': 3}
+
+
+def test_function_condition_must_be_given_again(tmp_path):
+    condition = lambda agent: agent.time_since_symptom_onset is not None
+    sim = Simulation(seed=1, diagnosis_condition_symptom=condition)
+    sim.initialize()
+    save_snapshot(sim, str(tmp_path / 'function.snap'))
+    with pytest.raises(ValueError, match='diagnosis_condition_symptom'):
+        load_snapshot(str(tmp_path / 'function.snap'))
+    restored = load_snapshot(str(tmp_path / 'function.snap'), diagnosis_condition_symptom=condition)
+    assert restored.diagnosis_condition_symptom is condition
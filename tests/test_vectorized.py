@@ -0,0 +1,67 @@
+"""
+test_vectorized.py
+VectorizedSimulation against Simulation, BatchedSimulation against VectorizedSimulation
+"""
+import numpy as np
+import pytest
+from batched import *
+
+PARAMETERS = {'population_size': 400, 'initial_infected_perc': 0.02, 'length': 40, 'height': 40,
+              'diagnosis_condition_symptom': 'agent.time_since_symptom_onset != None and '
+                                             'agent.time_since_symptom_onset >= 3',
+              'diagnosis_condition_tracing': 'agent.infector_time_since_diagnosis != None and '
+                                             'agent.infector_time_since_diagnosis >= 1'}
+
+STATISTICS = ['Susceptible', 'Infected', 'Recovered_Immune', 'Death', 'Isolated']
+
+
+def final_statistics(simulation_type, seeds, iterations=40):
+    result = []
+    for seed in seeds:
+        sim = simulation_type(seed=seed, **PARAMETERS)
+        sim.initialize()
+        for day in range(iterations):
+            sim.execute()
+        result.append([sim.get_statistics()[name] for name in STATISTICS])
+    return np.array(result)
+
+
+def test_statistically_equivalent_to_simulation():
+    """The means of the final statistics agree within the standard error of their difference"""
+    reference = final_statistics(Simulation, range(40))
+    vectorized = final_statistics(VectorizedSimulation, range(1000, 1040))
+    error = np.sqrt(reference.var(axis=0, ddof=1) / len(reference) + vectorized.var(axis=0, ddof=1) / len(vectorized))
+    difference = np.abs(reference.mean(axis=0) - vectorized.mean(axis=0))
+    assert np.all(difference <= 4 * error + 1e-3), dict(zip(STATISTICS, zip(difference, error)))
+    assert reference[:, STATISTICS.index('Susceptible')].mean() < 0.9
+
+
+def test_population_triggers_are_rejected():
+    trigger = {'condition': lambda agent: True, 'attribute': 'move', 'action': lambda agent: (0, 0)}
+    with pytest.raises(ValueError):
+        VectorizedSimulation(triggers_population=[trigger])
+    with pytest.raises(TypeError):
+        VectorizedSimulation().append_trigger_population(trigger['condition'], 'move', trigger['action'])
+
+
+@pytest.mark.parametrize('common_random_numbers', [False, True])
+def test_batch_replicates_match_vectorized_simulations(common_random_numbers):
+    """Replicate k of a batch gives the results of a VectorizedSimulation with seed seeds[k]"""
+    seeds = [3, 11, 29]
+    batch = BatchedSimulation(seeds=seeds, common_random_numbers=common_random_numbers, **PARAMETERS)
+    batch.initialize()
+    references = []
+    for seed in seeds:
+        sim = VectorizedSimulation(seed=seed, common_random_numbers=common_random_numbers, **PARAMETERS)
+        sim.initialize()
+        references.append(sim)
+    for day in range(30):
+        batch.execute()
+        for sim in references:
+            sim.execute()
+    for k, sim in enumerate(references):
+        replicate, reference = batch.get_replicate_columns(k), sim.get_columns()
+        for name in reference:
+            assert np.array_equal(np.asarray(replicate[name], dtype=float), np.asarray(reference[name], dtype=float),
+                                  equal_nan=True), (k, name)
+        assert np.any(reference['status'] != SUSCEPTIBLE)
@@ -0,0 +1,489 @@
+"""
+vectorized.py
+"""
+import numpy as np
+from abs import *
+
+SUSCEPTIBLE = code(Status.Susceptible)
+INFECTED = code(Status.Infected)
+RECOVERED_IMMUNE = code(Status.Recovered_Immune)
+DEATH = code(Status.Death)
+ASYMPTOMATIC = code(Symptom.Asymptomatic)
+SYMPTOMATIC = code(Symptom.Symptomatic)
+UNDIAGNOSED = code(Diagnosis.Undiagnosed)
+DIAGNOSED = code(Diagnosis.Diagnosed)
+NO_ISOLATION = code(Isolation.No_Isolation)
+ISOLATED = code(Isolation.Isolated)
+
+
+class VectorizedSimulation(Simulation):
+    """
+    Simulation keeping its population in NumPy arrays (one array per agent attribute) instead of a list
+    of agents.Agent instances, so each phase of an iteration is a masked array operation over the whole population.
+
+    It takes the same parameters and exposes the same initialize/execute/get_statistics/get_SIdata interface
+    as Simulation. The random numbers are drawn in blocks, so the results are statistically equivalent to,
+    but not draw by draw identical with, those of Simulation.
+    Population triggers are not supported: use the vectorized population triggers instead
+    (see Simulation.append_trigger_population_vectorized).
+    """
+    def __init__(self, **kwargs):
+        super(VectorizedSimulation, self).__init__(**kwargs)
+        if len(self.triggers_population) > 0:
+            raise ValueError("Population triggers are not supported by VectorizedSimulation, "
+                             "use triggers_population_vectorized")
+        self.columns = {}
+        '''The population of agents in array form, see agents.to_columns'''
+
+    def apply_triggers_population_vectorized(self):
+        """
+        Evaluate the vectorized population triggers on the arrays of the population
+        """
+        c = self.columns
+        for trigger in self.triggers_population_vectorized:
+            mask = np.asarray(trigger['condition'](c), dtype=bool)
+            if mask.any():
+                c[trigger['attribute']][mask] = trigger['action'](c[trigger['attribute']][mask])
+
+    def append_trigger_population(self, condition, attribute, action):
+        raise TypeError("Population triggers are not supported by VectorizedSimulation, "
+                        "use append_trigger_population_vectorized")
+
+    def get_population(self):
+        """
+        Return the population in the current iteration
+        :return: a list with agent instances built from the arrays
+        """
+        return [from_columns(self.columns, i) for i in range(len(self.columns['id']))]
+
+    def set_population(self, pop):
+        """
+        Update the population in the current iteration
+        """
+        self.columns = to_columns(pop)
+        self.contact_history = None
+        self._draw_incubations()
+
+    def initialize(self):
+        """
+        Initializate the Simulation by creating its population of agents
+        """
+        n = self.population_size
+        n_infected = int(self.population_size * self.initial_infected_perc)
+        n_immune = int(self.population_size * self.initial_immune_perc)
+
+        status = np.full(n, SUSCEPTIBLE, dtype=np.int8)
+        status[:n_infected] = INFECTED
+        status[n_infected:n_infected + n_immune] = RECOVERED_IMMUNE
+
+        self.columns = {'id': np.arange(1, n + 1, dtype=np.int64),
+                        'x': self._draw(n, 'positions', lambda rng, size: rng.uniform(0, self.length, size)),
+                        'y': self._draw(n, 'positions', lambda rng, size: rng.uniform(0, self.height, size)),
+                        'status': status,
+                        'symptom_status': np.full(n, ASYMPTOMATIC, dtype=np.int8),
+                        'diagnosis_status': np.full(n, UNDIAGNOSED, dtype=np.int8),
+                        'isolation_status': np.full(n, NO_ISOLATION, dtype=np.int8)}
+        for name in AGENT_NUMBERS:
+            self.columns[name] = np.full(n, np.nan)
+        self.columns['mobility'][:] = 1.0
+
+        """
+        Initial infected population
+        """
+        self.columns['incubation'][:n_infected] = 3
+        self.columns['transmission_route_known'][:n_infected] = 0
+        self.columns['time_since_infection'][:n_infected] = 0
+        self._emit(Event.Infection, self.columns['id'][:n_infected], np.full(n_infected, -1),
+                   np.full(n_infected, np.nan), self.columns['incubation'][:n_infected], iteration=-1)
+        self._emit_changes(Event.Recovery, status == RECOVERED_IMMUNE, iteration=-1)
+        self._draw_incubations()
+
+    def _draw(self, rows, purpose, draw):
+        """
+        Draw random numbers from the random number generator of a purpose, see Simulation.stream
+
+        :param rows: array with the population index of the agent of each number, or the number of agents for
+        one number per agent
+        :param purpose: a name in RANDOM_STREAMS
+        :param draw: a function (generator, size) returning an array of size random numbers
+        :return: an array with one random number per row
+        """
+        return draw(self.stream(purpose), rows if np.isscalar(rows) else len(rows))
+
+    def _draw_incubations(self):
+        """
+        With common random numbers, draw the incubation of each agent if it gets infected
+        """
+        if self.common_random_numbers:
+            self.incubations = self._draw(len(self.columns['id']), 'incubation',
+                                          lambda rng, size: incubation(1, size=size, rng=rng))
+
+    @staticmethod
+    def _cumulative_probability(infectee, probability):
+        """
+        Compute the probability of infection of each agent by its contacts so far, for common random numbers
+
+        :param infectee: array with the population index of the exposed agent of each contact, in contact order
+        :param probability: array with the probability of infection of each contact
+        :return: array with, for each contact, the probability that its exposed agent got infected by this contact
+        or one of its earlier contacts
+        """
+        order = np.argsort(infectee, kind='stable')
+        escape = np.cumsum(np.log1p(-probability[order]))
+        start = np.searchsorted(infectee[order], infectee[order], side='left')
+        result = np.empty(len(infectee))
+        result[order] = 1 - np.exp(escape - escape[start] + np.log1p(-probability[order][start]))
+        return result
+
+    def _detect_contacts(self, candidates):
+        """
+        Find the contacts between agents with the contact detection backend
+
+        :param candidates: sorted array with the population indexes of the agents which can be in contact
+        :return: two arrays (i, j) of population indexes with i < j, as returned by the backend
+        """
+        c = self.columns
+        first, second = contact_backend(self.contact_detection)(c['x'][candidates], c['y'][candidates],
+                                                                self.contagion_distance)
+        return candidates[first], candidates[second]
+
+    def _emit_changes(self, kind, mask, iteration=None):
+        """
+        Notify the observers of an event without infector nor values for the agents of a mask (or of an array
+        of population indexes), see Simulation._emit
+        """
+        ids = self.columns['id'][mask]
+        self._emit(kind, ids, np.full(len(ids), -1), np.full(len(ids), np.nan), np.full(len(ids), np.nan),
+                   iteration=iteration)
+
+    def move(self):
+        """
+        Performs the movement of all agents in the shared environment
+        """
+        c = self.columns
+        n = len(c['status'])
+        amplitudes = np.array([self.amplitudes.get(status, 0.0) for status in Status])[c['status']] * c['mobility']
+        mobile = (c['status'] != DEATH) & (c['isolation_status'] != ISOLATED)
+
+        for axis, limit in (('x', self.length), ('y', self.height)):
+            step = np.trunc(self._draw(n, 'movement', lambda rng, size: rng.standard_normal(size)) * amplitudes)
+            position = c[axis] + step
+            bounce = (position <= 0) | (position >= limit)
+            c[axis] = np.where(mobile, np.where(bounce, c[axis] - step, position), c[axis])
+
+    def update(self):
+        """
+        Update the status of all agents
+        """
+        c = self.columns
+        n = len(c['status'])
+        alive = c['status'] != DEATH
+        for name in TIMERS:
+            c[name][alive] += 1
+
+        infected = c['status'] == INFECTED
+        onset = (infected & (c['symptom_status'] == ASYMPTOMATIC) &
+                 (c['incubation'] <= c['time_since_infection']))
+        c['symptom_status'][onset] = SYMPTOMATIC
+        c['time_since_symptom_onset'][onset] = 0
+        self._emit_changes(Event.Symptom_Onset, onset)
+
+        death_test = self._draw(n, 'death', lambda rng, size: rng.random(size))
+        ended = infected & (c['symptom_status'] == SYMPTOMATIC) & (c['time_since_symptom_onset'] >= 10)
+        death = ended & (death_test <= IFR)
+        """
+        Infection fatality ratio is assumed to be 1% regardless of age
+        """
+        c['status'][death] = DEATH
+        c['status'][ended & ~death] = RECOVERED_IMMUNE
+        c['symptom_status'][ended] = ASYMPTOMATIC
+        self._emit_changes(Event.Death, death)
+        self._emit_changes(Event.Recovery, ended & ~death)
+
+        release = ((c['isolation_status'] == ISOLATED) & (c['time_since_isolation_start'] >= 14) &
+                   ((c['status'] == RECOVERED_IMMUNE) | (c['status'] == SUSCEPTIBLE)))
+        c['isolation_status'][release] = NO_ISOLATION
+        self._emit_changes(Event.Isolation_End, release)
+
+    def contact(self):
+        """
+        Find the contacts of the iteration and infect the susceptible agents.
+
+        Each contact pair is tested in both directions, in the order of Simulation.execute, and an agent
+        infected by an earlier contact can infect in the later ones. The first successful contact of each
+        susceptible agent is found for the agents infected at the start of the iteration, then again with
+        the newly infected agents as infectors, until no infection moves to an earlier contact.
+
+        :return: the number of infections
+        """
+        c = self.columns
+        n = len(c['status'])
+        """Dead and isolated agents are not contact candidates, as in Simulation.get_contacts"""
+        candidates = np.flatnonzero((c['status'] != DEATH) & (c['isolation_status'] == NO_ISOLATION))
+        first, second = self._detect_contacts(candidates)
+        self.record_contacts(first, second, n)
+        if self.metrics is not None:
+            self.metrics.phase('contact_detection')
+            self.metrics.count('contacts', len(first))
+        infectee = np.column_stack((first, second)).ravel()
+        infector = np.column_stack((second, first)).ravel()
+        order = np.arange(len(infectee))
+
+        mobile = c['isolation_status'] == NO_ISOLATION
+        exposed = ((c['status'][infectee] == SUSCEPTIBLE) & mobile[infector] &
+                   ((c['status'][infector] == INFECTED) | (c['status'][infector] == SUSCEPTIBLE)))
+        infectee = infectee[exposed]
+        infector = infector[exposed]
+        order = order[exposed]
+        if self.common_random_numbers:
+            """One number per agent, see Simulation.contact"""
+            contagion_test = self._draw(n, 'contagion', lambda rng, size: rng.random(size))
+        else:
+            contagion_test = self._draw(infectee, 'contagion', lambda rng, size: rng.random(size))
+
+        """position: the contact at which each agent got infected, -1 for the agents infected before"""
+        position = np.full(n, np.inf)
+        position[(c['status'] == INFECTED) & mobile] = -1
+        source = np.full(n, -1)
+        force_of_infection = np.zeros(n)
+        force_of_infection[position == -1] = SAR * infectiousness_curve(
+            c['time_since_infection'][position == -1] - c['incubation'][position == -1])
+        new_incubation = np.full(n, np.nan)
+
+        while True:
+            active = position[infector] < order
+            test = np.flatnonzero(active)
+            if self.common_random_numbers:
+                infected = test[self._cumulative_probability(infectee[test], force_of_infection[infector[test]]) >=
+                                contagion_test[infectee[test]]]
+            else:
+                infected = test[contagion_test[test] <= force_of_infection[infector[test]]]
+            targets, first_infection = np.unique(infectee[infected], return_index=True)
+            earlier = order[infected][first_infection] < position[targets]
+            if not earlier.any():
+                break
+            targets = targets[earlier]
+            position[targets] = order[infected][first_infection][earlier]
+            source[targets] = infector[infected][first_infection][earlier]
+            fresh = targets[np.isnan(new_incubation[targets])]
+            if self.common_random_numbers:
+                new_incubation[fresh] = self.incubations[fresh]
+            else:
+                new_incubation[fresh] = self._draw(fresh, 'incubation',
+                                                   lambda rng, size: incubation(1, size=size, rng=rng))
+            force_of_infection[targets] = SAR * infectiousness_curve(-new_incubation[targets])
+
+        infectee = np.flatnonzero(source >= 0)
+        infector = source[infectee]
+        new_infector = position[infector] >= 0
+        c['TSI'][infectee] = np.where(new_infector, 0, c['time_since_infection'][infector])
+        c['infector_incubation'][infectee] = np.where(new_infector, new_incubation[infector],
+                                                      c['incubation'][infector])
+        c['status'][infectee] = INFECTED
+        c['time_since_infection'][infectee] = 0
+        c['infector'][infectee] = c['id'][infector]
+        c['incubation'][infectee] = new_incubation[infectee]
+        self._emit(Event.Infection, c['id'][infectee], c['infector'][infectee].astype(np.int64),
+                   c['TSI'][infectee], c['incubation'][infectee])
+        return len(infectee)
+
+    def diagnosis(self):
+        """
+        Test the infected and undiagnosed agents meeting the tracing or the symptom diagnosis condition,
+        then isolate the diagnosed agents and notify the agents they infected.
+
+        As in Simulation, the agents are tested in population order: a notified agent (an infectee or a traced
+        contact) coming after the diagnosed agent in the population is tested again in the same iteration.
+
+        :return: the number of diagnoses
+        """
+        c = self.columns
+        n = len(c['status'])
+        detectability_test = self._draw(n, 'detection', lambda rng, size: rng.random(size))
+        candidates = np.flatnonzero((c['status'] == INFECTED) & (c['diagnosis_status'] == UNDIAGNOSED))
+        detected = np.zeros(n, dtype=bool)
+        detected[candidates] = (detectability_test[candidates] <
+                                detectability_curve(c['time_since_infection'][candidates] -
+                                                    c['incubation'][candidates]))
+
+        undiagnosed = c['diagnosis_status'] == UNDIAGNOSED
+        while len(candidates) > 0:
+            tested = {name: column[candidates] for name, column in c.items()}
+            tracing = np.zeros(n, dtype=bool)
+            symptom = np.zeros(n, dtype=bool)
+            tracing[candidates] = as_policy(self.diagnosis_condition_tracing).mask(tested)
+            symptom[candidates] = as_policy(self.diagnosis_condition_symptom).mask(tested)
+            diagnosed = np.flatnonzero((tracing | symptom) & detected)
+
+            c['transmission_route_known'][diagnosed] = np.where(tracing[diagnosed], 1, 0)
+            c['diagnosis_status'][diagnosed] = DIAGNOSED
+            c['time_since_diagnosis'][diagnosed] = 0
+            c['isolation_status'][diagnosed] = ISOLATED
+            c['time_since_isolation_start'][diagnosed] = 0
+            """Diagnosis and isolation are coupled"""
+
+            notified = np.flatnonzero(np.isin(c['infector'], c['id'][diagnosed]))
+            c['infector_time_since_diagnosis'][notified] = 0
+            by_id = np.argsort(c['id'][diagnosed])
+            infector_index = diagnosed[by_id][np.searchsorted(c['id'][diagnosed][by_id], c['infector'][notified])]
+            later = notified[notified > infector_index]
+            if self.contact_history is not None and len(diagnosed) > 0:
+                later = np.union1d(later, self.trace(diagnosed))
+            candidates = later[(c['status'][later] == INFECTED) &
+                               ((c['diagnosis_status'][later] == UNDIAGNOSED) |
+                                (c['time_since_diagnosis'][later] == 0))]
+
+        diagnosed = np.flatnonzero(undiagnosed & (c['diagnosis_status'] == DIAGNOSED))
+        infector = np.nan_to_num(c['infector'][diagnosed], nan=-1).astype(np.int64)
+        self._emit(Event.Diagnosis, c['id'][diagnosed], infector, c['transmission_route_known'][diagnosed],
+                   c['time_since_infection'][diagnosed])
+        self._emit_changes(Event.Isolation_Start, diagnosed)
+        return len(diagnosed)
+
+    def trace(self, diagnosed):
+        """
+        Notify the living agents met by the diagnosed agents within the contact tracing window, and quarantine them
+        if quarantine_contacts is set, see Simulation.trace
+
+        :param diagnosed: array with the population indexes of the diagnosed agents
+        :return: array with the population indexes of the traced agents coming after one of their diagnosed
+        contacts in the population
+        """
+        c = self.columns
+        tracer, traced = self.contact_history.query(diagnosed, self.iteration)
+        alive = c['status'][traced] != DEATH
+        tracer, traced = tracer[alive], traced[alive]
+        c['contact_time_since_diagnosis'][traced] = 0
+        if self.quarantine_contacts:
+            quarantined = np.unique(traced[c['isolation_status'][traced] == NO_ISOLATION])
+            c['isolation_status'][quarantined] = ISOLATED
+            c['time_since_isolation_start'][quarantined] = 0
+            self._emit_changes(Event.Isolation_Start, quarantined)
+        return np.unique(traced[traced > tracer])
+
+    def execute(self):
+        """
+        Execute a complete iteration cycle of the Simulation, executing all actions for the whole
+        population and updating the statistics
+        """
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.start(self.iteration)
+
+        self.apply_triggers_population_vectorized()
+        self.move()
+        self.update()
+        if metrics is not None:
+            metrics.phase('move_update')
+
+        infections = self.contact()
+        if metrics is not None:
+            metrics.phase('contact')
+            metrics.count('infections', infections)
+
+        if len(self.triggers_simulation) > 0:
+            for trigger in self.triggers_simulation:
+                if trigger['condition'](self):
+                    attr = trigger['attribute']
+                    self.__dict__[attr] = trigger['action'](self.__dict__[attr])
+        if metrics is not None:
+            metrics.phase('triggers')
+
+        diagnoses = self.diagnosis()
+        if metrics is not None:
+            metrics.phase('diagnosis')
+            metrics.count('diagnoses', diagnoses)
+            metrics.stop()
+
+        self.iteration += 1
+        self.statistics = None
+
+    def fast_forward(self, days):
+        """
+        Advance an extinct simulation by some iterations, updating only the timers, see Simulation.fast_forward
+
+        :param days: the number of iterations
+        """
+        alive = self.columns['status'] != DEATH
+        for name in TIMERS:
+            self.columns[name][alive] += days
+        self.iteration += days
+        self.statistics = None
+
+    def get_infectees(self, agent_id):
+        """
+        Return the agents infected by an agent
+
+        :param agent_id: the id of the infector
+        :return: a list with the ids of the infectees
+        """
+        return self.columns['id'][self.columns['infector'] == agent_id].tolist()
+
+    def get_transmission_tree(self):
+        """
+        Return all the transmissions of the simulation
+
+        :return: a list of (infector id, infectee id) tuples
+        """
+        infected = ~np.isnan(self.columns['infector'])
+        return list(zip(self.columns['infector'][infected].astype(np.int64).tolist(),
+                        self.columns['id'][infected].tolist()))
+
+    def get_positions(self):
+        """Return the list of x,y positions for all agents"""
+        return np.column_stack((self.columns['x'], self.columns['y'])).tolist()
+
+    def get_description(self, complete=False):
+        """
+        Return the list of Status and Symptom for all agents
+
+        :param complete: a flag indicating if the list must contain the Symptom (complete=True)
+        :return: a list of strings with the Status names
+        """
+        status = np.array([s.name for s in Status])[self.columns['status']]
+        if complete:
+            symptom = np.array([s.name for s in Symptom])[self.columns['symptom_status']]
+            return ["{}({})".format(s, sym) if s == Status.Infected.name else s for s, sym in zip(status, symptom)]
+        else:
+            return status.tolist()
+
+    def get_columns(self):
+        """
+        Return the population in array form
+        :return: the dictionary of arrays of the simulation, see agents.to_columns
+        """
+        return self.columns
+
+    def set_columns(self, columns):
+        """
+        Replace the population by a population in array form
+        :param columns: a dictionary with one array per agent attribute, see agents.to_columns
+        """
+        self.columns = {name: np.array(column) for name, column in columns.items()}
+        self.contact_history = None
+        self._draw_incubations()
+
+    def get_statistics(self):
+        """
+        Calculate and return the dictionary of the population statistics for the current iteration.
+
+        :infection status statiscs, symptom status statistics, isolation status statistics
+        :return: a dictionary
+        """
+        if self.statistics is None:
+            c = self.columns
+            alive = c['status'] != DEATH
+            self.statistics = {}
+            counts = np.bincount(c['status'], minlength=len(Status))
+            for status in Status:
+                self.statistics[status.name] = counts[code(status)] / self.population_size
+            counts = np.bincount(c['symptom_status'][alive], minlength=len(Symptom))
+            for symptom_status in Symptom:
+                self.statistics[symptom_status.name] = counts[code(symptom_status)] / self.population_size
+            counts = np.bincount(c['isolation_status'][alive], minlength=len(Isolation))
+            for isolation_status in Isolation:
+                self.statistics[isolation_status.name] = counts[code(isolation_status)] / self.population_size
+            route = c['transmission_route_known']
+            self.statistics['transmission_route_known'] = np.sum(route == 1) / np.sum(~np.isnan(route))
+
+        return self.statistics